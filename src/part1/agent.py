@@ -2,42 +2,82 @@
 This is the main agent for the part 1 of the project. See evaluate.py for running the agent on the evaluation dataset.
 """
 
+import asyncio
 import os
+import threading
+import time
 from typing import List, Literal
 
+from context_compaction import CONTEXT_KEEP_RECENT, compact_messages
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain.messages import AIMessage, HumanMessage, SystemMessage
 from langchain.tools import BaseTool
 from langchain_core.messages import BaseMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import END, START, StateGraph
-from langgraph.prebuilt import ToolNode
+from langgraph.graph.state import CompiledStateGraph
+from llm_usage import call_usage, over_budget, prompt_cache_tokens
+from openai import APIStatusError
 from prompts import (
     BROWSE_AGENT_SYSTEM_PROMPT,
     RAW_AGENT_SYSTEM_PROMPT,
     SEARCH_AGENT_SYSTEM_PROMPT,
 )
-from schema import BaseAgentState
-from tools import browse, search, submit_answer
+import run_stats
+from rate_limit import backoff_delay, chat_limiter, parse_retry_after
+from schema import BaseAgentState, Step
+from text_utils import estimate_tokens
+from tool_execution import create_tool_node
+from tools import browse, find_in_page, multi_search, search, submit_answer
 
 load_dotenv()
 
 
+def is_throttled(e: Exception) -> bool:
+    return isinstance(e, APIStatusError) and e.status_code in (429, 503)
+
+
+def llm_step(step_number: int, ai_message: AIMessage, llm_seconds: float, reclaimed_tokens: int = 0) -> Step:
+    """Per-step LLM telemetry, merged by step_reducer into the step that the tool calls of `ai_message` record."""
+    step = Step(step_number=step_number, actions=[], llm_seconds=round(llm_seconds, 3))
+    if len(ai_message.tool_calls) > 1:
+        run_stats.incr("tools.parallel_steps")
+    if reclaimed_tokens > 0:
+        step["context_reclaimed_tokens"] = reclaimed_tokens
+    cache_tokens = prompt_cache_tokens(ai_message)
+    if cache_tokens is not None:
+        step["prompt_cache_hit_tokens"], step["prompt_cache_miss_tokens"] = cache_tokens
+        run_stats.incr("llm.prompt_cache_hit_tokens", cache_tokens[0])
+        run_stats.incr("llm.prompt_cache_miss_tokens", cache_tokens[1])
+    return step
+
+
 def create_agent[S: BaseAgentState](
     state_cls: type[S], system_prompt: str, tools: List[BaseTool]
 ):
-    llm = init_chat_model(
-        model="deepseek-chat", api_key=os.getenv("DEEPSEEK_API_KEY")
-    ).bind_tools(tools)
+    # Retries are left to invoke_llm so that they go through the shared chat limiter.
+    chat_model = init_chat_model(
+        model="deepseek-chat", api_key=os.getenv("DEEPSEEK_API_KEY"), max_retries=0
+    )
+    llm = chat_model.bind_tools(tools)
+    # Same tools (and so the same cacheable prompt prefix), but the call must be submit_answer.
+    submit_llm = chat_model.bind_tools(tools, tool_choice="submit_answer")
 
     def invoke_llm(
-        messages: List[BaseMessage], state: S, max_retries: int = 3
+        messages: List[BaseMessage], state: S, force_submit: bool = False, max_retries: int = 5
     ) -> AIMessage:
-        for _ in range(max_retries):
+        for attempt in range(max_retries):
             try:
-                ai_message = llm.invoke(messages)
+                with chat_limiter.slot() as slot:
+                    try:
+                        ai_message = (submit_llm if force_submit else llm).invoke(messages)
+                    except APIStatusError as e:
+                        if is_throttled(e):
+                            slot.throttle(parse_retry_after(e.response.headers), attempt)
+                        raise
+                    slot.success()
                 if ai_message.invalid_tool_calls:
                     raise Exception(
                         f"Invalid tool calls: {ai_message.invalid_tool_calls}"
@@ -46,10 +86,40 @@ def create_agent[S: BaseAgentState](
             except Exception as e:
                 print(f"Error in answering question {state['question']}")
                 print(f"Error invoking LLM, retrying...: {e}")
+                # Throttled calls already wait in the limiter before the next attempt.
+                if not is_throttled(e):
+                    time.sleep(backoff_delay(attempt))
                 continue
         raise Exception(f"Failed to invoke LLM after {max_retries} retries")
 
-    def agent(state: S, config: RunnableConfig) -> dict:
+    async def ainvoke_llm(
+        messages: List[BaseMessage], state: S, force_submit: bool = False, max_retries: int = 5
+    ) -> AIMessage:
+        for attempt in range(max_retries):
+            try:
+                async with chat_limiter.aslot() as slot:
+                    try:
+                        ai_message = await (submit_llm if force_submit else llm).ainvoke(messages)
+                    except APIStatusError as e:
+                        if is_throttled(e):
+                            slot.throttle(parse_retry_after(e.response.headers), attempt)
+                        raise
+                    slot.success()
+                if ai_message.invalid_tool_calls:
+                    raise Exception(
+                        f"Invalid tool calls: {ai_message.invalid_tool_calls}"
+                    )
+                return ai_message
+            except Exception as e:
+                print(f"Error in answering question {state['question']}")
+                print(f"Error invoking LLM, retrying...: {e}")
+                # Throttled calls already wait in the limiter before the next attempt.
+                if not is_throttled(e):
+                    await asyncio.sleep(backoff_delay(attempt))
+                continue
+        raise Exception(f"Failed to invoke LLM after {max_retries} retries")
+
+    def max_steps_update(state: S, config: RunnableConfig) -> dict | None:
         if state["current_step"] >= config["configurable"]["max_steps"]:
             return {
                 "messages": [
@@ -59,28 +129,109 @@ def create_agent[S: BaseAgentState](
                 ],
                 "answer": "<answer>failure</answer>",
             }
+        return None
 
-        if len(state["messages"]) == 0:  # At the beginning of the conversation
-            human_message = HumanMessage(content=state["question"])
-            ai_message = invoke_llm(
-                [SystemMessage(content=system_prompt), human_message], state
-            )
+    def over_question_budget(state: S, config: RunnableConfig) -> bool:
+        return over_budget(
+            state.get("usage") or {},
+            config["configurable"].get("max_question_tokens", 0),
+            config["configurable"].get("max_question_cost", 0),
+        )
+
+    def budget_update(state: S) -> dict | None:
+        """Stops a question whose forced submission did not end it (e.g. the answer was rejected by submit_answer)."""
+        if state.get("budget_exhausted"):
             return {
-                "messages": [human_message, ai_message],
-                "current_step": state["current_step"] + 1,
+                "messages": [
+                    HumanMessage(
+                        content="<system_reminder>Exceeded the token budget of this question. Stop.</system_reminder>"
+                    )
+                ],
+                "answer": "<answer>failure</answer>",
             }
+        return None
+
+    def prepare_turn(state: S, config: RunnableConfig) -> tuple[List[BaseMessage], List[BaseMessage], int, bool]:
+        """build_prompt, plus a final reminder when the question is over budget. The last item tells whether the call must be submit_answer."""
+        messages, new_messages, reclaimed_tokens = build_prompt(state, config)
+        if not over_question_budget(state, config):
+            return messages, new_messages, reclaimed_tokens, False
+        budget_reminder = HumanMessage(
+            content="<system_reminder>The token budget of this question is used up. Submit your best answer now with `submit_answer`.</system_reminder>"
+        )
+        return [*messages, budget_reminder], [*new_messages, budget_reminder], reclaimed_tokens, True
+
+    def turn_update(state: S, new_messages: List[BaseMessage], ai_message: AIMessage, llm_seconds: float, reclaimed_tokens: int, force_submit: bool) -> dict:
+        update = {
+            "messages": [*new_messages, ai_message],
+            "current_step": state["current_step"] + 1,
+            "steps": [llm_step(state["current_step"] + 1, ai_message, llm_seconds, reclaimed_tokens)],
+            "usage": call_usage(ai_message),
+        }
+        if force_submit:
+            run_stats.incr("llm.budget_forced_submissions")
+            update["budget_exhausted"] = True
+        return update
+
+    def build_history(state: S, config: RunnableConfig) -> tuple[List[BaseMessage], List[BaseMessage], int]:
+        """The message history to send, compacted when the prompt would exceed the context token budget, the compacted messages, and the number of tokens reclaimed.
+
+        The compacted messages keep their ids, so returning them in the state update replaces the originals (see add_messages): the prefix changes once, at the compaction, and later prompts extend it.
+        """
+        token_budget = config["configurable"].get("context_token_budget", 0)
+        if token_budget <= 0:
+            return state["messages"], [], 0
+        history, reclaimed_tokens = compact_messages(
+            state["messages"],
+            state["question"],
+            token_budget - estimate_tokens(system_prompt),
+            config["configurable"].get("context_keep_recent", CONTEXT_KEEP_RECENT),
+        )
+        if reclaimed_tokens > 0:
+            run_stats.incr("context.compactions")
+            run_stats.incr("context.reclaimed_tokens", reclaimed_tokens)
+        compacted = [message for message, original in zip(history, state["messages"]) if message is not original]
+        return history, compacted, reclaimed_tokens
+
+    def build_prompt(state: S, config: RunnableConfig) -> tuple[List[BaseMessage], List[BaseMessage], int]:
+        """Returns the messages to send to the LLM, the ones among them that are new to the state, and the tokens reclaimed by compaction.
+
+        The "reminder" layout appends a fresh question reminder after the history on every turn. The "stable" layout adds the reminder to the state once, after the first tool outputs, so every prompt extends the previous one byte for byte and DeepSeek can serve the whole prefix from its context cache.
+        """
+        if len(state["messages"]) == 0:  # At the beginning of the conversation
+            human_message = HumanMessage(content=state["question"])
+            return [SystemMessage(content=system_prompt), human_message], [human_message], 0
+
+        history, compacted, reclaimed_tokens = build_history(state, config)
+        system_reminder = HumanMessage(
+            content=f"<system_reminder>The current question your are investigating is: [{state['question']}]. If you have not yet found out the answer, please ignore this system reminder and continue to make use of tools provided to you (if any) to gather more information and think about how to answer the question. If you are confident that you have found out the answer, please use `submit_answer` tool to submit the answer.</system_reminder>"
+        )
+        if config["configurable"].get("message_layout", "reminder") == "stable":
+            if any(message.content == system_reminder.content for message in history):
+                return [SystemMessage(content=system_prompt), *history], compacted, reclaimed_tokens
+            return [SystemMessage(content=system_prompt), *history, system_reminder], [*compacted, system_reminder], reclaimed_tokens
         else:
-            system_reminder = f"<system_reminder>The current question your are investigating is: [{state['question']}]. If you have not yet found out the answer, please ignore this system reminder and continue to make use of tools provided to you (if any) to gather more information and think about how to answer the question. If you are confident that you have found out the answer, please use `submit_answer` tool to submit the answer.</system_reminder>"
+            return [SystemMessage(content=system_prompt), *history, system_reminder], compacted, reclaimed_tokens
 
-            ai_message = invoke_llm(
-                [
-                    SystemMessage(content=system_prompt),
-                    *state["messages"],
-                    HumanMessage(content=system_reminder),
-                ],
-                state,
-            )
-            return {"messages": [ai_message], "current_step": state["current_step"] + 1}
+    def agent(state: S, config: RunnableConfig) -> dict:
+        update = max_steps_update(state, config) or budget_update(state)
+        if update is not None:
+            return update
+
+        messages, new_messages, reclaimed_tokens, force_submit = prepare_turn(state, config)
+        started = time.monotonic()
+        ai_message = invoke_llm(messages, state, force_submit)
+        return turn_update(state, new_messages, ai_message, time.monotonic() - started, reclaimed_tokens, force_submit)
+
+    async def aagent(state: S, config: RunnableConfig) -> dict:
+        update = max_steps_update(state, config) or budget_update(state)
+        if update is not None:
+            return update
+
+        messages, new_messages, reclaimed_tokens, force_submit = prepare_turn(state, config)
+        started = time.monotonic()
+        ai_message = await ainvoke_llm(messages, state, force_submit)
+        return turn_update(state, new_messages, ai_message, time.monotonic() - started, reclaimed_tokens, force_submit)
 
     def should_continue(state: S) -> Literal["agent", END]:
         if state["answer"] is not None:
@@ -89,8 +240,8 @@ def create_agent[S: BaseAgentState](
 
     return (
         StateGraph(state_cls)
-        .add_node("agent", agent)
-        .add_node("tools", ToolNode(tools))
+        .add_node("agent", RunnableLambda(agent, afunc=aagent, name="agent"))
+        .add_node("tools", create_tool_node(tools))
         .add_edge(START, "agent")
         .add_edge("agent", "tools")
         .add_conditional_edges("tools", should_continue)
@@ -100,7 +251,7 @@ def create_agent[S: BaseAgentState](
 
 def create_search_agent():
     return create_agent(
-        BaseAgentState, SEARCH_AGENT_SYSTEM_PROMPT, [search, submit_answer]
+        BaseAgentState, SEARCH_AGENT_SYSTEM_PROMPT, [search, multi_search, submit_answer]
     )
 
 
@@ -110,5 +261,33 @@ def create_raw_agent():
 
 def create_browse_agent():
     return create_agent(
-        BaseAgentState, BROWSE_AGENT_SYSTEM_PROMPT, [search, browse, submit_answer]
+        BaseAgentState, BROWSE_AGENT_SYSTEM_PROMPT, [search, multi_search, browse, find_in_page, submit_answer]
     )
+
+
+AGENT_FACTORIES = {
+    "search": create_search_agent,
+    "raw": create_raw_agent,
+    "browse": create_browse_agent,
+}
+_agents = dict[str, CompiledStateGraph]()
+_agents_lock = threading.Lock()
+
+
+def get_agent(agent_type: Literal["search", "browse", "raw"]) -> CompiledStateGraph:
+    """The compiled agent of this type, built once and shared by all questions (and threads) of the run. Questions are isolated by their thread_id; call release_thread when a question is done."""
+    if agent_type not in AGENT_FACTORIES:
+        raise ValueError(f"Invalid agent type: {agent_type}")
+    with _agents_lock:
+        if agent_type not in _agents:
+            _agents[agent_type] = AGENT_FACTORIES[agent_type]()
+        return _agents[agent_type]
+
+
+def release_thread(agent: CompiledStateGraph, thread_id: str):
+    """Drops the checkpoints of a finished question, so that the shared checkpointer does not grow with the run."""
+    agent.checkpointer.delete_thread(thread_id)
+
+
+async def arelease_thread(agent: CompiledStateGraph, thread_id: str):
+    await agent.checkpointer.adelete_thread(thread_id)
@@ -0,0 +1,154 @@
+"""
+Pool of Serper API keys. Requests are spread over the keys with a per-key request rate and daily quota; keys that are rejected (invalid, out of credits) leave the rotation, and throttled keys sit out a cooldown. Other failures (5xx, pages that cannot be scraped, transport errors) are not the key's fault and leave it alone. Daily usage is kept in a SQLite file under CACHE_DIR so that the quota holds across runs.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+import httpx
+import run_stats
+from cache import CACHE_DIR, connect
+from dotenv import load_dotenv
+from rate_limit import backoff_delay, parse_retry_after
+
+load_dotenv()
+
+SERPER_API_KEYS = [key.strip() for key in os.getenv("SERPER_API_KEYS", os.getenv("SERPER_API_KEY") or "").split(",") if key.strip()]
+SERPER_KEY_RATE = float(os.getenv("SERPER_KEY_RATE", 0))  # requests per second per key, 0 = unlimited
+SERPER_KEY_DAILY_QUOTA = int(os.getenv("SERPER_KEY_DAILY_QUOTA", 0))  # requests per UTC day per key, 0 = unlimited
+KEY_REJECTED_STATUS_CODES = {401, 403}
+KEY_THROTTLE_STATUS_CODES = {429}
+ASYNC_POLL_INTERVAL = 0.02
+
+
+class NoApiKeyError(RuntimeError):
+    pass
+
+
+def today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+class ApiKey:
+    def __init__(self, value: str, used_today: int):
+        self.value = value
+        self.key_id = hashlib.sha256(value.encode()).hexdigest()[:12]
+        self.used_today = used_today
+        self.in_flight = 0
+        self.rejected = False
+        self.cooldown_until = 0.0
+        self.tokens = 1.0
+        self.refilled_at = time.monotonic()
+
+
+class KeyPool:
+    def __init__(self, name: str, values: list[str], rate: float = SERPER_KEY_RATE, daily_quota: int = SERPER_KEY_DAILY_QUOTA, usage_path=CACHE_DIR / "serper_keys.sqlite"):
+        self.name = name
+        self.rate = rate
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+        self._day = today()
+        self._conn = connect(usage_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS usage (key_id TEXT, day TEXT, used INTEGER, PRIMARY KEY (key_id, day))")
+        self.keys = [ApiKey(value, 0) for value in dict.fromkeys(values)]
+        self._load_usage()
+
+    def _load_usage(self):
+        """Must hold the lock (or be in __init__)."""
+        for key in self.keys:
+            row = self._conn.execute("SELECT used FROM usage WHERE key_id = ? AND day = ?", (key.key_id, self._day)).fetchone()
+            key.used_today = row[0] if row is not None else 0
+
+    def _exhausted(self, key: ApiKey) -> bool:
+        return self.daily_quota > 0 and key.used_today >= self.daily_quota
+
+    def _try_acquire(self) -> tuple[ApiKey | None, float]:
+        """Picks the usable key with the fewest requests in flight (then the least used today). Returns (key, 0), or (None, seconds to wait). Must hold the lock."""
+        if self._day != today():
+            self._day = today()
+            self._load_usage()
+        now = time.monotonic()
+        candidates = [key for key in self.keys if not key.rejected and not self._exhausted(key)]
+        if not candidates:
+            raise NoApiKeyError(f"All {len(self.keys)} {self.name} API keys are rejected or out of daily quota.")
+
+        waits = []
+        ready = []
+        for key in candidates:
+            if self.rate > 0:
+                key.tokens = min(max(1.0, self.rate), key.tokens + (now - key.refilled_at) * self.rate)
+                key.refilled_at = now
+            if now < key.cooldown_until:
+                waits.append(key.cooldown_until - now)
+            elif self.rate > 0 and key.tokens < 1:
+                waits.append((1 - key.tokens) / self.rate)
+            else:
+                ready.append(key)
+        if not ready:
+            return None, min(waits)
+
+        key = min(ready, key=lambda key: (key.in_flight, key.used_today))
+        if self.rate > 0:
+            key.tokens -= 1
+        key.in_flight += 1
+        return key, 0.0
+
+    def acquire(self) -> ApiKey | None:
+        """A key for the next request, or None when the pool is empty (requests then go out without a key, e.g. to the mock server)."""
+        if not self.keys:
+            return None
+        while True:
+            with self._lock:
+                key, delay = self._try_acquire()
+            if key is not None:
+                return key
+            time.sleep(delay)
+
+    async def aacquire(self) -> ApiKey | None:
+        if not self.keys:
+            return None
+        while True:
+            with self._lock:
+                key, delay = self._try_acquire()
+            if key is not None:
+                return key
+            await asyncio.sleep(max(delay, ASYNC_POLL_INTERVAL))
+
+    def throttles_key(self, response: httpx.Response) -> bool:
+        """With several keys, a 429 is taken as the key's own limit: only that key backs off, not the whole upstream."""
+        return response.status_code in KEY_THROTTLE_STATUS_CODES and len(self.keys) > 1
+
+    def report(self, key: ApiKey, response: httpx.Response | None, attempt: int = 0) -> bool:
+        """Records the outcome of a request made with `key` (None: it raised). Returns True when the failure was the key's fault, so a retry with another key may succeed."""
+        with self._lock:
+            key.in_flight -= 1
+            if response is not None and response.status_code < 400:
+                key.used_today += 1
+                self._conn.execute(
+                    "INSERT INTO usage VALUES (?, ?, 1) ON CONFLICT (key_id, day) DO UPDATE SET used = used + 1",
+                    (key.key_id, self._day),
+                )
+                run_stats.incr(f"{self.name}.key.{key.key_id}.request")
+                return False
+
+            if response is not None and (response.status_code in KEY_REJECTED_STATUS_CODES or is_out_of_credits(response)):
+                key.rejected = True
+                run_stats.incr(f"{self.name}.key.{key.key_id}.rejected")
+                return True
+            if response is not None and response.status_code in KEY_THROTTLE_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers)
+                key.cooldown_until = time.monotonic() + (retry_after if retry_after is not None else backoff_delay(attempt))
+                run_stats.incr(f"{self.name}.key.{key.key_id}.throttled")
+                return self.throttles_key(response)
+            return False
+
+
+def is_out_of_credits(response: httpx.Response) -> bool:
+    return response.status_code in (400, 402) and "credit" in response.text.lower()
+
+
+serper_keys = KeyPool("serper", SERPER_API_KEYS)
@@ -0,0 +1,226 @@
+"""
+Persistent caches for the Serper tools in tools.py. Entries live in a SQLite file under CACHE_DIR so they survive across runs and are shared by all worker threads.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+import run_stats
+import zstandard
+from dotenv import load_dotenv
+from near_duplicate import band_keys, is_near_duplicate
+
+load_dotenv()
+
+CACHE_DIR = Path(os.getenv("PART1_CACHE_DIR", Path(__file__).parent.parent.parent / ".cache"))
+SEARCH_CACHE_ENABLED = os.getenv("SERPER_SEARCH_CACHE", "1") != "0"
+SEARCH_CACHE_TTL = float(os.getenv("SERPER_SEARCH_CACHE_TTL", 7 * 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SERPER_SEARCH_CACHE_MAX_ENTRIES", 100_000))
+NEAR_DUPLICATE_CACHE_ENABLED = os.getenv("SERPER_NEAR_DUPLICATE_CACHE", "0") == "1"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("SERPER_NEAR_DUPLICATE_THRESHOLD", 0.8))
+PAGE_CACHE_ENABLED = os.getenv("SERPER_PAGE_CACHE", "1") != "0"
+PAGE_CACHE_TTL = float(os.getenv("SERPER_PAGE_CACHE_TTL", 30 * 24 * 3600))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("SERPER_PAGE_CACHE_MAX_BYTES", 2 * 1024**3))
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src", "spm", "_ga", "_gl"}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def canonicalize_url(url: str) -> str:
+    """Maps variant links of the same page to one key: scheme, `www.`, default ports, fragments, tracking parameters, parameter order, percent-encoding and trailing slashes are ignored."""
+    parts = urlsplit(url.strip() if "//" in url else "//" + url.strip())
+    host = (parts.hostname or "").removeprefix("www.")
+    if parts.port is not None and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = quote(unquote(parts.path), safe="/:@!$&'()*+,;=-._~") or "/"
+    if path != "/":
+        path = path.rstrip("/")
+    params = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    return f"//{host}{path}" + (f"?{urlencode(params)}" if params else "")
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class SearchCache:
+    """Serper search responses keyed by (normalized query, page, num), with TTL expiry and LRU eviction. With `near_duplicate_threshold`, queries are also indexed by their MinHash band keys so that rephrasings can be served from a similar cached query (see get_similar)."""
+
+    def __init__(self, path: Path, ttl: float, max_entries: int, near_duplicate_threshold: float | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search ("
+            "query TEXT, page INTEGER, num INTEGER, response TEXT, created_at REAL, accessed_at REAL, "
+            "PRIMARY KEY (query, page, num))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_accessed_at ON search (accessed_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_bands (band TEXT, query TEXT, PRIMARY KEY (band, query)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS query_bands_query ON query_bands (query)")
+
+    def get(self, query: str, page: int, num: int) -> dict | None:
+        key = (normalize_query(query), page, num)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM search WHERE query = ? AND page = ? AND num = ?", key
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM search WHERE query = ? AND page = ? AND num = ?", key)
+                run_stats.incr("search_cache.expired")
+                row = None
+            if row is None:
+                run_stats.incr("search_cache.miss")
+                return None
+            self._conn.execute(
+                "UPDATE search SET accessed_at = ? WHERE query = ? AND page = ? AND num = ?", (now, *key)
+            )
+        run_stats.incr("search_cache.hit")
+        return json.loads(row[0])
+
+    def get_similar(self, query: str, page: int, num: int) -> tuple[str, dict] | None:
+        """The most recently used fresh entry of a near-duplicate query with the same page and num, as (cached query, response)."""
+        if self.near_duplicate_threshold is None:
+            return None
+        keys = band_keys(query)
+        normalized = normalize_query(query)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT search.query, search.response FROM search JOIN "
+                f"(SELECT DISTINCT query FROM query_bands WHERE band IN ({', '.join('?' * len(keys))})) USING (query) "
+                "WHERE search.page = ? AND search.num = ? AND search.query != ? AND search.created_at >= ? "
+                "ORDER BY search.accessed_at DESC",
+                (*keys, page, num, normalized, time.time() - self.ttl),
+            ).fetchall()
+        for cached_query, response in rows:
+            if is_near_duplicate(normalized, cached_query, self.near_duplicate_threshold):
+                run_stats.incr("search_cache.near_duplicate_hit")
+                return cached_query, json.loads(response)
+        run_stats.incr("search_cache.near_duplicate_miss")
+        return None
+
+    def put(self, query: str, page: int, num: int, response: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_query(query), page, num, json.dumps(response), now, now),
+            )
+            # Indexed even while the near-duplicate tier is off, so that turning it on can use everything cached so far.
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO query_bands VALUES (?, ?)",
+                [(key, normalize_query(query)) for key in band_keys(query)],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM search").fetchone()
+            if count > self.max_entries:
+                evicted = self._conn.execute(
+                    "DELETE FROM search WHERE rowid IN (SELECT rowid FROM search ORDER BY accessed_at LIMIT ?) RETURNING query",
+                    (count - self.max_entries,),
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM query_bands WHERE query = ? AND NOT EXISTS (SELECT 1 FROM search WHERE search.query = query_bands.query)",
+                    evicted,
+                )
+                run_stats.incr("search_cache.evicted", count - self.max_entries)
+
+
+class PageStore:
+    """Scraped pages keyed by canonicalized URL. Bodies are zstd-compressed and stored once per content hash, with TTL expiry and LRU eviction under a total size cap."""
+
+    def __init__(self, path: Path, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, digest TEXT, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bodies (digest TEXT PRIMARY KEY, body BLOB, size INTEGER)")
+        (self._total_bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()
+
+    def get(self, url: str) -> str | None:
+        key = canonicalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bodies.body, pages.created_at FROM pages JOIN bodies USING (digest) WHERE pages.url = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._delete_page(key)
+                run_stats.incr("page_cache.expired")
+                row = None
+            if row is None:
+                run_stats.incr("page_cache.miss")
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, key))
+        run_stats.incr("page_cache.hit")
+        return zstandard.decompress(row[0]).decode()
+
+    def put(self, url: str, content: str):
+        key = canonicalize_url(url)
+        raw = content.encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._delete_page(key)
+            if self._conn.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone() is None:
+                body = zstandard.compress(raw)
+                self._conn.execute("INSERT INTO bodies VALUES (?, ?, ?)", (digest, body, len(body)))
+                self._total_bytes += len(body)
+            else:
+                run_stats.incr("page_cache.deduplicated")
+            self._conn.execute("INSERT INTO pages VALUES (?, ?, ?, ?)", (key, digest, now, now))
+            while self._total_bytes > self.max_bytes:
+                row = self._conn.execute("SELECT url FROM pages ORDER BY accessed_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._delete_page(row[0])
+                run_stats.incr("page_cache.evicted")
+
+    def _delete_page(self, key: str):
+        """Drops a URL entry, and its body too once no other URL shares it. Must hold the lock."""
+        row = self._conn.execute("DELETE FROM pages WHERE url = ? RETURNING digest", (key,)).fetchone()
+        if row is None or self._conn.execute("SELECT 1 FROM pages WHERE digest = ?", row).fetchone() is not None:
+            return
+        (size,) = self._conn.execute("DELETE FROM bodies WHERE digest = ? RETURNING size", row).fetchone()
+        self._total_bytes -= size
+
+
+search_cache = (
+    SearchCache(
+        CACHE_DIR / "serper.sqlite",
+        SEARCH_CACHE_TTL,
+        SEARCH_CACHE_MAX_ENTRIES,
+        NEAR_DUPLICATE_THRESHOLD if NEAR_DUPLICATE_CACHE_ENABLED else None,
+    )
+    if SEARCH_CACHE_ENABLED
+    else None
+)
+page_store = (
+    PageStore(CACHE_DIR / "pages.sqlite", PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES)
+    if PAGE_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,70 @@
+"""
+Compaction of the agent's prompt between turns: once the history exceeds a token budget, the oldest tool outputs are replaced by extractive summaries (search results without their snippets, the passages of a page most relevant to the question), while the most recent ones stay verbatim. The agent writes the compacted messages back to the state, so an output is compacted once and later prompts extend the compacted history instead of rewriting it.
+
+Search deduplication (see tools.seen_step) shows a link already returned by an earlier step as "(seen in step N)" instead of its snippet, so the snippets of links that some output refers back to are kept.
+"""
+
+import json
+import re
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from passages import select_passages
+from text_utils import estimate_tokens
+
+CONTEXT_KEEP_RECENT = 3
+COMPACTED_PAGE_TOKENS = 300
+SEARCH_TOOLS = {"search", "multi_search"}
+PAGE_TOOLS = {"browse", "find_in_page"}
+ENTRY = re.compile(r"<Entry>\n<Title>.*?</Title>\n<Link>(.*?)</Link>\n<Snippet>.*?</Snippet>\n</Entry>\n", re.DOTALL)
+SNIPPET = re.compile(r"<Snippet>.*?</Snippet>\n", re.DOTALL)
+COMPACTED_PREFIX = "[Compacted earlier "
+BACK_REFERENCE = re.compile(r"<Link>([^<]*)</Link>\n<Snippet>\(seen in step \d+\)</Snippet>")
+
+
+def message_tokens(message: BaseMessage) -> int:
+    tokens = estimate_tokens(message.content if isinstance(message.content, str) else json.dumps(message.content))
+    if isinstance(message, AIMessage) and message.tool_calls:
+        tokens += estimate_tokens(json.dumps([call["args"] for call in message.tool_calls]))
+    return tokens
+
+
+def referenced_links(messages: list[BaseMessage]) -> set[str]:
+    """Links shown as "(seen in step N)" back-references by deduplicated search outputs."""
+    return {link for message in messages if isinstance(message, ToolMessage) and isinstance(message.content, str) for link in BACK_REFERENCE.findall(message.content)}
+
+
+def compact_tool_output(tool_name: str, content: str, question: str, keep_links: set[str] = frozenset()) -> str | None:
+    """An extractive summary of an old tool output, or None if it is not worth compacting. Search snippets of `keep_links` are kept."""
+    if tool_name in SEARCH_TOOLS:
+        compacted = ENTRY.sub(lambda match: match.group(0) if match.group(1) in keep_links else SNIPPET.sub("", match.group(0)), content)
+        compacted = re.sub(r"<PeopleAlsoAsk>.*?</PeopleAlsoAsk>\n", "", compacted, flags=re.DOTALL)
+        return COMPACTED_PREFIX + "search results: snippets removed, except for links that later results refer back to.]\n" + compacted
+    if tool_name in PAGE_TOOLS:
+        passages = select_passages(content, question, COMPACTED_PAGE_TOKENS)
+        return COMPACTED_PREFIX + "page content: only the passages most relevant to the question are kept; call the tool again to re-read the page.]\n" + passages
+    return None
+
+
+def compact_messages(messages: list[BaseMessage], question: str, token_budget: int, keep_recent: int = CONTEXT_KEEP_RECENT) -> tuple[list[BaseMessage], int]:
+    """Compacts tool outputs oldest first, skipping the `keep_recent` latest, until the messages fit in `token_budget`. Returns the messages and the number of tokens reclaimed."""
+    total_tokens = sum(message_tokens(message) for message in messages)
+    if total_tokens <= token_budget:
+        return messages, 0
+
+    tool_names = {call["id"]: call["name"] for message in messages if isinstance(message, AIMessage) for call in message.tool_calls}
+    tool_indices = [i for i, message in enumerate(messages) if isinstance(message, ToolMessage)]
+    keep_links = referenced_links(messages)
+    compacted_messages = list(messages)
+    reclaimed_tokens = 0
+    for i in tool_indices[: max(0, len(tool_indices) - keep_recent)]:
+        if total_tokens - reclaimed_tokens <= token_budget:
+            break
+        message = messages[i]
+        if not isinstance(message.content, str) or message.content.startswith(COMPACTED_PREFIX):
+            continue
+        compacted = compact_tool_output(tool_names.get(message.tool_call_id, ""), message.content, question, keep_links)
+        if compacted is None or estimate_tokens(compacted) >= estimate_tokens(message.content):
+            continue
+        compacted_messages[i] = message.model_copy(update={"content": compacted})
+        reclaimed_tokens += estimate_tokens(message.content) - estimate_tokens(compacted)
+    return compacted_messages, reclaimed_tokens
@@ -0,0 +1,94 @@
+"""
+In-memory cache of browsed documents: a page is fetched and prepared (compacted) once per run, and later calls such as `browse(url, page=n)` or `find_in_page` are served from the prepared text.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import run_stats
+from dotenv import load_dotenv
+from page_index import PositionalIndex
+from text_utils import CHARS_PER_TOKEN
+
+load_dotenv()
+
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", 512))
+
+
+def split_windows(text: str, token_budget: int) -> list[str]:
+    """Splits the text into windows of at most `token_budget` tokens, breaking at line boundaries where possible."""
+    max_chars = max(1, token_budget) * CHARS_PER_TOKEN
+    windows = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                windows.append("".join(current))
+                current, size = [], 0
+            windows.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) > max_chars and current:
+            windows.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        windows.append("".join(current))
+    return [window.strip() for window in windows if window.strip()] or [""]
+
+
+class Document:
+    """A prepared page. Derived structures are built on first use and kept with the document."""
+
+    def __init__(self, text: str, raw_tokens: int):
+        self.text = text
+        self.raw_tokens = raw_tokens
+        self._lock = threading.Lock()
+        self._windows = dict[int, list[str]]()
+        self._index = None
+
+    def windows(self, token_budget: int) -> list[str]:
+        with self._lock:
+            if token_budget not in self._windows:
+                self._windows[token_budget] = split_windows(self.text, token_budget)
+            return self._windows[token_budget]
+
+    def index(self) -> PositionalIndex:
+        with self._lock:
+            if self._index is None:
+                self._index = PositionalIndex(self.text)
+            return self._index
+
+
+class DocumentCache:
+    """Thread-safe LRU of documents."""
+
+    def __init__(self, max_documents: int = DOCUMENT_CACHE_SIZE):
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._documents = OrderedDict[str, Document]()
+
+    def get(self, key: str) -> Document | None:
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+        run_stats.incr("documents.hit" if document is not None else "documents.miss")
+        return document
+
+    def put(self, key: str, document: Document) -> Document:
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+
+documents = DocumentCache()
@@ -5,58 +5,114 @@ Command:
 uv run src/part1/evaluate.py --run_name nosearch --agent_type raw   # no search agent
 uv run src/part1/evaluate.py --run_name search --agent_type search  # search agent
 uv run src/part1/evaluate.py --run_name browse --agent_type browse  # browse agent
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --async_concurrency 200  # asyncio driver instead of threads
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --browse_mode passages  # browse returns question-relevant passages only
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --browse_mode paged  # long pages are read one window at a time with browse(url, page=n)
+uv run src/part1/evaluate.py --run_name browse_raw --agent_type browse --no_compact_markdown  # browse returns the scraped markdown verbatim
+SERPER_NEAR_DUPLICATE_CACHE=1 uv run src/part1/evaluate.py --run_name search --agent_type search  # also serve rephrased queries from the search cache, see cache.py
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --message_layout stable  # append-only prompts for DeepSeek's prefix cache
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --context_token_budget 16000  # compact old tool outputs in long trajectories
+uv run src/part1/evaluate.py --run_name browse --agent_type browse --max_question_tokens 50000  # force submit_answer once a question used 50k tokens
+uv run src/part1/evaluate.py --run_name search_local --agent_type search --search_backend local  # offline BM25 index, see local_search.py
 
 You can find the evaluation results in the results/part1 directory.
 """
 
 import argparse
+import asyncio
 import json
 import subprocess
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Literal
 from pprint import pprint
+from uuid import uuid4
 
-from agent import create_browse_agent, create_raw_agent, create_search_agent
+import http_client
+import run_stats
+from agent import arelease_thread, get_agent, release_thread
+from llm_usage import usage_report
 from schema import BaseAgentState
+from tools import LOCAL_INDEX_DIR, prefetcher
 from tqdm import tqdm
 
 RECURSION_LIMIT = 50
 MAX_STEPS = 20
+MAX_WORKERS = 60
+MAX_ASYNC_CONCURRENCY = 200
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 INPUT_FILE = PROJECT_ROOT / "data" / "nq_test_100.jsonl"
 OUTPUT_DIR = PROJECT_ROOT / "results" / "part1"
 
 
-def evaluate_single_question(
-    id: str,
-    question: str,
-    ground_truths: list[str],
-    agent_type: Literal["search", "browse", "raw"] = "browse",
-    enable_streaming: bool = False,
-):
-    if agent_type == "search":
-        agent = create_search_agent()
-    elif agent_type == "raw":
-        agent = create_raw_agent()
-    elif agent_type == "browse":
-        agent = create_browse_agent()
-    else:
-        raise ValueError(f"Invalid agent type: {agent_type}")
+def create_agent_by_type(agent_type: Literal["search", "browse", "raw"]):
+    """The shared agent of this type (compiled once per run, see agent.get_agent)."""
+    return get_agent(agent_type)
+
 
+def create_init_state_and_config(id: str, question: str, configurable: dict | None = None):
     init_state = BaseAgentState(
         messages=[],
         current_step=0,
         question=question,
         answer=None,
         steps=[],
+        usage={},
     )
 
     config = {
-        "configurable": {"thread_id": id, "max_steps": MAX_STEPS},
+        # Unique per invocation: all questions share the agent's checkpointer, and the dataset id may repeat.
+        "configurable": {"thread_id": f"{id}-{uuid4()}", "max_steps": MAX_STEPS, **(configurable or {})},
         "recursion_limit": RECURSION_LIMIT,
     }
 
+    return init_state, config
+
+
+def build_results(id: str, question: str, ground_truths: list[str], state: BaseAgentState):
+    usage = usage_report(state.get("usage") or {})
+    trajectory = {
+        "id": id,
+        "question": question,
+        "ground_truths": ground_truths,
+        "trajectory": {
+            "question": question,
+            "steps": state["steps"],
+            "final_answer": state["answer"],
+            "total_search_steps": len([step for step in state["steps"] if step["actions"]]),
+            "usage": usage,
+        },
+    }
+
+    prediction = {
+        "id": id,
+        "question": question,
+        "answers": ground_truths,
+        "llm_response": state["answer"],
+        "usage": usage,
+    }
+
+    return trajectory, prediction
+
+
+def print_failed_state(state: BaseAgentState, e: Exception):
+    print("================================================")
+    pprint(state)
+    print("================================================")
+    print(f"Error: \n{e}\n")
+
+
+def evaluate_single_question(
+    id: str,
+    question: str,
+    ground_truths: list[str],
+    agent_type: Literal["search", "browse", "raw"] = "browse",
+    enable_streaming: bool = False,
+    configurable: dict | None = None,
+):
+    agent = create_agent_by_type(agent_type)
+    init_state, config = create_init_state_and_config(id, question, configurable)
+
     state: BaseAgentState
     
     try:
@@ -78,39 +134,46 @@ def evaluate_single_question(
             state = agent.invoke(init_state, config=config)
     except Exception as e:
         state = agent.get_state(config=config).values
-        print("================================================")
-        pprint(state)
-        print("================================================")
-        print(f"Error: \n{e}\n")
+        print_failed_state(state, e)
         raise e
+    finally:
+        release_thread(agent, config["configurable"]["thread_id"])
 
-    trajectory = {
-        "id": id,
-        "question": question,
-        "ground_truths": ground_truths,
-        "trajectory": {
-            "question": question,
-            "steps": state["steps"],
-            "final_answer": state["answer"],
-            "total_search_steps": len(state["steps"]),
-        },
-    }
+    return build_results(id, question, ground_truths, state)
 
-    prediction = {
-        "id": id,
-        "question": question,
-        "answers": ground_truths,
-        "llm_response": state["answer"],
-    }
 
-    return trajectory, prediction
+async def aevaluate_single_question(
+    id: str,
+    question: str,
+    ground_truths: list[str],
+    agent_type: Literal["search", "browse", "raw"] = "browse",
+    configurable: dict | None = None,
+):
+    agent = create_agent_by_type(agent_type)
+    init_state, config = create_init_state_and_config(id, question, configurable)
+
+    state: BaseAgentState
+
+    try:
+        state = await agent.ainvoke(init_state, config=config)
+    except Exception as e:
+        state = (await agent.aget_state(config=config)).values
+        print_failed_state(state, e)
+        raise e
+    finally:
+        await arelease_thread(agent, config["configurable"]["thread_id"])
+
+    return build_results(id, question, ground_truths, state)
 
 
 def evaluate_batch_questions(
     questions: list[dict[Literal["id", "question", "answers"], str]],
     agent_type: Literal["search", "raw"] = "search",
+    configurable: dict | None = None,
+    max_workers: int = MAX_WORKERS,
 ):
-    with ThreadPoolExecutor(max_workers=60) as executor:
+    http_client.set_pool_size(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [
             executor.submit(
                 evaluate_single_question,
@@ -118,15 +181,47 @@ def evaluate_batch_questions(
                 question["question"],
                 question["answers"],
                 agent_type,
+                configurable=configurable,
             )
             for question in questions
         ]
         results = [
             future.result() for future in tqdm(futures, desc="Evaluating questions")
         ]
+    prefetcher.close()
     return results
 
 
+async def aevaluate_batch_questions(
+    questions: list[dict[Literal["id", "question", "answers"], str]],
+    agent_type: Literal["search", "raw"] = "search",
+    concurrency: int = MAX_ASYNC_CONCURRENCY,
+    configurable: dict | None = None,
+):
+    """Same as evaluate_batch_questions, but runs the questions as coroutines on one event loop, at most `concurrency` at a time."""
+    http_client.set_pool_size(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = tqdm(total=len(questions), desc="Evaluating questions")
+
+    async def evaluate(question: dict[Literal["id", "question", "answers"], str]):
+        async with semaphore:
+            result = await aevaluate_single_question(
+                question["id"],
+                question["question"],
+                question["answers"],
+                agent_type,
+                configurable,
+            )
+        progress.update()
+        return result
+
+    try:
+        return await asyncio.gather(*(evaluate(question) for question in questions))
+    finally:
+        progress.close()
+        await prefetcher.aclose()
+
+
 def load_questions(
     input_file: str,
 ) -> list[dict[Literal["id", "question", "answers"], str]]:
@@ -139,21 +234,61 @@ def save_results(results: list[tuple[dict, dict]], output_dir: str, run_name: st
     output_dir.mkdir(parents=True, exist_ok=True)
     trajectory_file = output_dir / f"trajectories_{run_name}.jsonl"
     prediction_file = output_dir / f"predictions_{run_name}.jsonl"
+    stats_file = output_dir / f"stats_{run_name}.json"
 
     with trajectory_file.open("w") as t, prediction_file.open("w") as p:
         for trajectory, prediction in results:
             t.write(json.dumps(trajectory) + "\n")
             p.write(json.dumps(prediction) + "\n")
 
+    stats = run_stats.snapshot()
+    stats_file.write_text(json.dumps(stats, indent=2))
+    print("Run stats:")
+    pprint(stats)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--run_name", type=str, required=True)
     parser.add_argument("--agent_type", type=str, required=True)
+    parser.add_argument("--max_workers", type=int, default=MAX_WORKERS, help="Number of worker threads of the thread-pool driver")
+    parser.add_argument("--async_concurrency", type=int, default=0, help="Run with the asyncio driver at this concurrency instead of the thread pool")
+    parser.add_argument("--message_layout", type=str, default="reminder", choices=["reminder", "stable"], help="Append a question reminder to every prompt, or add it to the history once so that prompts stay append-only and their prefix hits DeepSeek's context cache")
+    parser.add_argument("--max_question_tokens", type=int, default=0, help="Force submit_answer once the LLM calls of a question used this many prompt and completion tokens (0: no budget)")
+    parser.add_argument("--max_question_cost", type=float, default=0, help="Force submit_answer once the LLM calls of a question cost this many USD (0: no budget)")
+    parser.add_argument("--context_token_budget", type=int, default=0, help="Compact old tool outputs once the prompt exceeds this many tokens (0: never). Compacted outputs replace the originals in the history, so each compaction misses the context cache once")
+    parser.add_argument("--context_keep_recent", type=int, default=3, help="Number of latest tool outputs that are never compacted")
+    parser.add_argument("--browse_mode", type=str, default="full", choices=["full", "passages", "paged"], help="Return whole pages, only the passages most relevant to the question, or one page-sized window at a time")
+    parser.add_argument("--no_compact_markdown", action="store_true", help="Do not strip navigation, links, images and boilerplate from browsed pages")
+    parser.add_argument("--no_search_features", action="store_true", help="Do not show the answer box, knowledge graph, people also ask and related searches of Serper results")
+    parser.add_argument("--no_search_dedup", action="store_true", help="Repeat the full snippets of links already shown by earlier searches of the trajectory")
+    parser.add_argument("--browse_token_budget", type=int, default=2000, help="Token budget of the browse tool in passages and paged modes")
+    parser.add_argument("--prefetch_top_n", type=int, default=0, help="Scrape the top N links of every search in the background (browse agent)")
+    parser.add_argument("--search_backend", type=str, default="serper", choices=["serper", "local"], help="Search with Serper, or offline with the BM25 index built by local_search.py")
+    parser.add_argument("--local_index", type=str, default=LOCAL_INDEX_DIR.as_posix(), help="Index directory of the local search backend")
     args = parser.parse_args()
 
+    configurable = {
+        "message_layout": args.message_layout,
+        "max_question_tokens": args.max_question_tokens,
+        "max_question_cost": args.max_question_cost,
+        "context_token_budget": args.context_token_budget,
+        "context_keep_recent": args.context_keep_recent,
+        "browse_mode": args.browse_mode,
+        "compact_markdown": not args.no_compact_markdown,
+        "browse_token_budget": args.browse_token_budget,
+        "dedup_search_results": not args.no_search_dedup,
+        "search_features": not args.no_search_features,
+        "prefetch_top_n": args.prefetch_top_n,
+        "search_backend": args.search_backend,
+        "local_index": args.local_index,
+    }
+
     questions = load_questions(INPUT_FILE)
-    results = evaluate_batch_questions(questions, args.agent_type)
+    if args.async_concurrency > 0:
+        results = asyncio.run(aevaluate_batch_questions(questions, args.agent_type, args.async_concurrency, configurable))
+    else:
+        results = evaluate_batch_questions(questions, args.agent_type, configurable, args.max_workers)
     save_results(results, OUTPUT_DIR / args.run_name, args.run_name)
 
     subprocess.run(
@@ -0,0 +1,191 @@
+"""
+Tail-latency protection for slow upstream calls. A call that has not finished after the recent p95 latency gets a duplicate (hedge) request and the first useful result wins, and a per-host circuit breaker fails fast on hosts that keep timing out.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, TypeVar
+from urllib.parse import urlsplit
+
+import run_stats
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 8))
+HEDGE_MIN_DELAY = 0.5
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", 128))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", 120))
+CIRCUIT_SLOW_SECONDS = float(os.getenv("CIRCUIT_SLOW_SECONDS", 30))
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies of successful calls."""
+
+    def __init__(self, size: int = 512):
+        self._lock = threading.Lock()
+        self._samples = deque[float](maxlen=size)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self, quantile: float = HEDGE_QUANTILE) -> float:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            samples = sorted(self._samples)
+        return max(HEDGE_MIN_DELAY, samples[min(len(samples) - 1, math.ceil(quantile * len(samples)) - 1)])
+
+
+class Hedger:
+    """Runs `fn` and, if it has not returned after the hedge delay, a second copy of it; returns the first non-None result. `fn` must not raise.
+
+    `fn(started)` calls `started()` when its upstream request actually goes out, i.e. after any local queueing such as a rate limiter slot (and again for each retry). The hedge delay and the latency samples run from there, so local queueing neither triggers hedges nor inflates the p95.
+    """
+
+    def __init__(self, name: str, max_workers: int = HEDGE_MAX_WORKERS):
+        self.name = name
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-hedge")
+
+    def timed(self, fn: Callable[[Callable[[], None]], T | None], started: threading.Event) -> Callable[[], T | None]:
+        def call():
+            started_at = None
+
+            def on_start():
+                nonlocal started_at
+                started_at = time.monotonic()
+                started.set()
+
+            result = fn(on_start)
+            if result is not None and started_at is not None:
+                self.latency.record(time.monotonic() - started_at)
+            return result
+        return call
+
+    def atimed(self, fn: Callable[[Callable[[], None]], Awaitable[T | None]], started: asyncio.Event) -> Callable[[], Awaitable[T | None]]:
+        async def call():
+            started_at = None
+
+            def on_start():
+                nonlocal started_at
+                started_at = time.monotonic()
+                started.set()
+
+            result = await fn(on_start)
+            if result is not None and started_at is not None:
+                self.latency.record(time.monotonic() - started_at)
+            return result
+        return call
+
+    def _winner(self, is_hedge: bool):
+        run_stats.incr(f"{self.name}.hedge_won" if is_hedge else f"{self.name}.primary_won")
+
+    def call(self, fn: Callable[[Callable[[], None]], T | None]) -> T | None:
+        started = threading.Event()
+        primary = self._executor.submit(self.timed(fn, started))
+        # Also released when the primary returns without a request (e.g. a local error).
+        primary.add_done_callback(lambda _: started.set())
+        started.wait()
+        done, _ = wait([primary], timeout=self.latency.hedge_delay())
+        if done:
+            return primary.result()
+
+        run_stats.incr(f"{self.name}.hedge_issued")
+        hedge = self._executor.submit(self.timed(fn, threading.Event()))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    self._winner(future is hedge)
+                    return result
+        return None
+
+    async def acall(self, fn: Callable[[Callable[[], None]], Awaitable[T | None]]) -> T | None:
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self.atimed(fn, started)())
+        primary.add_done_callback(lambda _: started.set())
+        pending = {primary}
+        try:
+            await started.wait()
+            done, pending = await asyncio.wait(pending, timeout=self.latency.hedge_delay())
+            if done:
+                return primary.result()
+
+            run_stats.incr(f"{self.name}.hedge_issued")
+            hedge = asyncio.ensure_future(self.atimed(fn, asyncio.Event())())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        self._winner(task is hedge)
+                        return result
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class CircuitBreaker:
+    """Per-host breaker: after `failure_threshold` consecutive failures the host is rejected for `cooldown` seconds, then one trial call is let through (half-open)."""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = dict[str, int]()
+        self._open_until = dict[str, float]()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return (urlsplit(url).hostname or url).lower()
+
+    def allow(self, url: str) -> bool:
+        host = self.host(url)
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return True
+            if time.monotonic() < open_until:
+                run_stats.incr(f"{self.name}.rejected")
+                return False
+            # Half-open: let this call through, and keep rejecting others until it reports back.
+            self._open_until[host] = time.monotonic() + self.cooldown
+            return True
+
+    def success(self, url: str):
+        host = self.host(url)
+        with self._lock:
+            self._failures.pop(host, None)
+            if self._open_until.pop(host, None) is not None:
+                run_stats.incr(f"{self.name}.closed")
+
+    def record(self, url: str, seconds: float):
+        """Completed calls slower than CIRCUIT_SLOW_SECONDS count as failures too."""
+        self.failure(url) if seconds > CIRCUIT_SLOW_SECONDS else self.success(url)
+
+    def failure(self, url: str):
+        host = self.host(url)
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            run_stats.incr(f"{self.name}.failure")
+            if self._failures[host] >= self.failure_threshold:
+                if host not in self._open_until:
+                    run_stats.incr(f"{self.name}.opened")
+                self._open_until[host] = time.monotonic() + self.cooldown
@@ -0,0 +1,176 @@
+"""
+Process-wide pooled HTTP clients for the Serper tools in tools.py. All worker threads share one keep-alive pool (and each event loop one async pool), so TCP/TLS setup is paid once per connection instead of once per call, and every request has connect/read timeouts.
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from typing import Callable
+
+import httpx
+import run_stats
+from dotenv import load_dotenv
+from api_keys import KeyPool
+from rate_limit import UpstreamLimiter, backoff_delay, parse_retry_after
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+THROTTLE_STATUS_CODES = {429, 503}
+# Failures before the upstream saw or started answering the request. A read timeout is not retried: the host is slow, and another
+# full read timeout rarely helps (scrape hedging and the circuit breaker in tools.py deal with slow hosts).
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.ProtocolError)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") == "1" and importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_client: httpx.Client | None = None
+_async_clients = weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]()
+_pool_size = HTTP_POOL_SIZE
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=_pool_size, max_keepalive_connections=_pool_size)
+
+
+def set_pool_size(pool_size: int):
+    """Resize the shared pool, e.g. to the number of evaluation workers. Takes effect on the next request (async clients: on the next event loop)."""
+    global _client, _pool_size
+    with _lock:
+        _pool_size = pool_size
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_client() -> httpx.Client:
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(http2=HTTP2_ENABLED, timeout=_timeout(), limits=_limits())
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = httpx.AsyncClient(http2=HTTP2_ENABLED, timeout=_timeout(), limits=_limits())
+        return client
+
+
+def record_request(new_connection: bool):
+    run_stats.incr("http.request")
+    run_stats.incr("http.new_connection" if new_connection else "http.reused_connection")
+
+
+def send(url: str, payload: dict, headers: dict) -> httpx.Response:
+    new_connection = False
+
+    def trace(event_name: str, info: dict):
+        nonlocal new_connection
+        if event_name == "connection.connect_tcp.complete":
+            new_connection = True
+
+    # Like requests, drop unset headers (e.g. a missing API key) instead of failing.
+    headers = {key: value for key, value in headers.items() if value is not None}
+    response = get_client().post(url, json=payload, headers=headers, extensions={"trace": trace})
+    record_request(new_connection)
+    return response
+
+
+async def asend(url: str, payload: dict, headers: dict) -> httpx.Response:
+    new_connection = False
+
+    async def trace(event_name: str, info: dict):
+        nonlocal new_connection
+        if event_name == "connection.connect_tcp.complete":
+            new_connection = True
+
+    headers = {key: value for key, value in headers.items() if value is not None}
+    response = await get_async_client().post(url, json=payload, headers=headers, extensions={"trace": trace})
+    record_request(new_connection)
+    return response
+
+
+def is_retryable(response: httpx.Response) -> bool:
+    return response.status_code in THROTTLE_STATUS_CODES or response.status_code >= 500
+
+
+def post(url: str, payload: dict, headers: dict, limiter: UpstreamLimiter, keys: KeyPool | None = None, key_header: str = "X-API-KEY", on_slot: Callable[[], None] | None = None) -> httpx.Response:
+    """POSTs under `limiter`. Throttled responses (429/503) shrink its window and block it for Retry-After (or a jittered backoff) before the retry; other 5xx and connection-level transport errors (RETRYABLE_TRANSPORT_ERRORS) are retried after a jittered backoff, and the last one is raised. Other transport errors, e.g. read timeouts, are raised at once. With `keys`, every attempt takes a key from the pool, and a response that is the key's fault (rejected, out of credits, throttled) is retried at once with another key. `on_slot` is called whenever an attempt has its limiter slot and goes out."""
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        key = keys.acquire() if keys is not None else None
+        if key is not None:
+            headers = {**headers, key_header: key.value}
+        response = None
+        try:
+            with limiter.slot() as slot:
+                if on_slot is not None:
+                    on_slot()
+                response = send(url, payload, headers)
+                if response.status_code in THROTTLE_STATUS_CODES and not (keys is not None and keys.throttles_key(response)):
+                    slot.throttle(parse_retry_after(response.headers), attempt)
+                elif response.status_code < 500:
+                    slot.success()
+        except RETRYABLE_TRANSPORT_ERRORS:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+        finally:
+            key_failed = key is not None and keys.report(key, response, attempt)
+        if response is None:
+            run_stats.incr("http.transport_retry")
+            time.sleep(backoff_delay(attempt))
+            continue
+        if key_failed and attempt < HTTP_MAX_RETRIES:
+            run_stats.incr("http.key_retry")
+            continue
+        if not is_retryable(response) or attempt == HTTP_MAX_RETRIES:
+            return response
+        run_stats.incr("http.retry")
+        if response.status_code not in THROTTLE_STATUS_CODES:
+            time.sleep(backoff_delay(attempt))
+
+
+async def apost(url: str, payload: dict, headers: dict, limiter: UpstreamLimiter, keys: KeyPool | None = None, key_header: str = "X-API-KEY", on_slot: Callable[[], None] | None = None) -> httpx.Response:
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        key = await keys.aacquire() if keys is not None else None
+        if key is not None:
+            headers = {**headers, key_header: key.value}
+        response = None
+        try:
+            async with limiter.aslot() as slot:
+                if on_slot is not None:
+                    on_slot()
+                response = await asend(url, payload, headers)
+                if response.status_code in THROTTLE_STATUS_CODES and not (keys is not None and keys.throttles_key(response)):
+                    slot.throttle(parse_retry_after(response.headers), attempt)
+                elif response.status_code < 500:
+                    slot.success()
+        except RETRYABLE_TRANSPORT_ERRORS:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+        finally:
+            key_failed = key is not None and keys.report(key, response, attempt)
+        if response is None:
+            run_stats.incr("http.transport_retry")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        if key_failed and attempt < HTTP_MAX_RETRIES:
+            run_stats.incr("http.key_retry")
+            continue
+        if not is_retryable(response) or attempt == HTTP_MAX_RETRIES:
+            return response
+        run_stats.incr("http.retry")
+        if response.status_code not in THROTTLE_STATUS_CODES:
+            await asyncio.sleep(backoff_delay(attempt))
@@ -0,0 +1,71 @@
+"""
+Token and cost accounting of the LLM calls of one question. The agent node adds the usage of every call to the state (see schema.usage_reducer), evaluate.py writes it to the predictions and trajectories, and the agent forces `submit_answer` once a question exceeds its token or cost budget.
+"""
+
+import os
+
+import run_stats
+from dotenv import load_dotenv
+from langchain.messages import AIMessage
+from schema import Usage
+
+load_dotenv()
+
+# USD per million tokens, deepseek-chat list prices.
+PRICE_CACHE_HIT = float(os.getenv("DEEPSEEK_PRICE_CACHE_HIT", 0.028))
+PRICE_CACHE_MISS = float(os.getenv("DEEPSEEK_PRICE_CACHE_MISS", 0.28))
+PRICE_OUTPUT = float(os.getenv("DEEPSEEK_PRICE_OUTPUT", 0.42))
+
+
+def prompt_cache_tokens(ai_message: AIMessage) -> tuple[int, int] | None:
+    """(hit, miss) prompt tokens of DeepSeek's context cache for one call, from the raw usage or else from usage_metadata."""
+    usage = ai_message.response_metadata.get("token_usage") or {}
+    hit, miss = usage.get("prompt_cache_hit_tokens"), usage.get("prompt_cache_miss_tokens")
+    if isinstance(hit, int) and isinstance(miss, int):
+        return hit, miss
+    if ai_message.usage_metadata is None:
+        return None
+    hit = (ai_message.usage_metadata.get("input_token_details") or {}).get("cache_read") or 0
+    return hit, ai_message.usage_metadata["input_tokens"] - hit
+
+
+def call_usage(ai_message: AIMessage) -> Usage:
+    usage = Usage(llm_calls=1, input_tokens=0, output_tokens=0, cache_hit_tokens=0)
+    if ai_message.usage_metadata is not None:
+        usage["input_tokens"] = ai_message.usage_metadata["input_tokens"]
+        usage["output_tokens"] = ai_message.usage_metadata["output_tokens"]
+    cache_tokens = prompt_cache_tokens(ai_message)
+    if cache_tokens is not None:
+        usage["cache_hit_tokens"] = cache_tokens[0]
+    run_stats.incr("llm.calls")
+    run_stats.incr("llm.input_tokens", usage["input_tokens"])
+    run_stats.incr("llm.output_tokens", usage["output_tokens"])
+    return usage
+
+
+def total_tokens(usage: Usage) -> int:
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def usage_cost(usage: Usage) -> float:
+    """Cost in USD."""
+    hit = usage.get("cache_hit_tokens", 0)
+    miss = usage.get("input_tokens", 0) - hit
+    return (hit * PRICE_CACHE_HIT + miss * PRICE_CACHE_MISS + usage.get("output_tokens", 0) * PRICE_OUTPUT) / 1e6
+
+
+def usage_report(usage: Usage) -> dict:
+    """The usage as written to the result files."""
+    return {
+        "llm_calls": usage.get("llm_calls", 0),
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_hit_tokens": usage.get("cache_hit_tokens", 0),
+        "total_tokens": total_tokens(usage),
+        "cost_usd": round(usage_cost(usage), 6),
+    }
+
+
+def over_budget(usage: Usage, max_tokens: int = 0, max_cost: float = 0) -> bool:
+    """Budgets of 0 are unlimited."""
+    return (max_tokens > 0 and total_tokens(usage) >= max_tokens) or (max_cost > 0 and usage_cost(usage) >= max_cost)
@@ -0,0 +1,230 @@
+"""
+Offline BM25 search backend with the same interface as tools.search_api_call, so the Part 1 agents can run and be load-tested without network access or Serper quota.
+
+The index is built from a local corpus (documents harvested from trajectories_*.jsonl files and/or JSONL dumps with title/url/text fields, e.g. a Wikipedia dump) into a directory of flat files. Documents are streamed through the build, and postings are written in sorted on-disk blocks that are merged at the end, so memory stays bounded for corpora much larger than RAM. The postings are memory-mapped at query time, so loading is instant and queries take milliseconds.
+
+Command:
+uv run src/part1/local_search.py --output .cache/local_index --trajectories results/part1/search/trajectories_search.jsonl
+uv run src/part1/local_search.py --output .cache/local_index --jsonl wikipedia.jsonl
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from functools import cache
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from cache import canonicalize_url
+from schema import SearchEntry
+from dotenv import load_dotenv
+from text_utils import tokenize
+
+load_dotenv()
+
+BM25_K1 = 0.9
+BM25_B = 0.4
+SNIPPET_WORDS = 30
+POSTING = struct.Struct("<II")  # (doc id, term frequency)
+BLOCK_HEADER = struct.Struct("<HI")  # (term length in bytes, number of postings)
+BLOCK_POSTINGS = int(os.getenv("LOCAL_INDEX_BLOCK_POSTINGS", 5_000_000))  # postings held in memory before a block is written
+
+
+class LocalDocument(SearchEntry):
+    text: str
+
+
+def harvest_trajectories(paths: Iterable[Path]) -> Iterator[LocalDocument]:
+    """Yields one document per distinct link seen in the trajectories: search snippets, plus the browsed page content when there is one."""
+    documents = dict[str, LocalDocument]()
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                for step in json.loads(line)["trajectory"]["steps"]:
+                    for action in step["actions"]:
+                        if action["action"] == "search":
+                            for entry in action["retrieved_documents"]:
+                                document = documents.setdefault(canonicalize_url(entry["link"]), LocalDocument(title=entry["title"], link=entry["link"], snippet=entry["snippet"], text=""))
+                                if entry["snippet"] not in document["text"]:
+                                    document["text"] = f"{document['text']}\n{entry['snippet']}".strip()
+                        elif action["action"] == "browse" and not action["browsed_content"].startswith("Failed to read"):
+                            key = canonicalize_url(action["url"])
+                            document = documents.setdefault(key, LocalDocument(title=action["url"], link=action["url"], snippet="", text=""))
+                            document["text"] = f"{document['text']}\n{action['browsed_content']}".strip()
+    yield from documents.values()
+
+
+def load_jsonl_documents(paths: Iterable[Path]) -> Iterator[LocalDocument]:
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                text = record.get("text") or record.get("snippet") or ""
+                yield LocalDocument(title=record.get("title", ""), link=record.get("url") or record.get("link", ""), snippet=record.get("snippet", ""), text=text)
+
+
+def write_block(postings: dict[str, array], path: Path):
+    """Writes the postings of one block sorted by term: per term a header, the UTF-8 term and its (doc id, frequency) pairs."""
+    with open(path, "wb") as f:
+        for term in sorted(postings):
+            encoded = term.encode()
+            f.write(BLOCK_HEADER.pack(len(encoded), len(postings[term]) // 2))
+            f.write(encoded)
+            postings[term].tofile(f)
+
+
+def read_block(path: Path, block_number: int) -> Iterator[tuple[str, int, bytes]]:
+    """Yields (term, block number, packed postings) in term order."""
+    with open(path, "rb") as f:
+        while header := f.read(BLOCK_HEADER.size):
+            term_length, num_postings = BLOCK_HEADER.unpack(header)
+            yield f.read(term_length).decode(), block_number, f.read(num_postings * POSTING.size)
+
+
+def build_index(documents: Iterable[LocalDocument], output_dir: Path, block_postings: int = BLOCK_POSTINGS) -> int:
+    """Writes docs.jsonl (+ docs.offsets), doc_lengths.bin, postings.bin and vocabulary.json to `output_dir`, and returns the number of documents.
+
+    Documents are consumed one at a time. Postings are buffered until `block_postings` of them, then written as a sorted block; the blocks are k-way merged into postings.bin. Blocks hold increasing doc ids, so concatenating a term's postings in block order keeps them sorted by doc id.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    doc_lengths = array("I")
+    doc_offsets = array("Q")
+
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix="blocks-") as blocks_dir:
+        block_paths = list[Path]()
+        postings = defaultdict[str, array](lambda: array("I"))
+        buffered = 0
+
+        def flush():
+            nonlocal postings, buffered
+            block_paths.append(Path(blocks_dir) / f"{len(block_paths)}.bin")
+            write_block(postings, block_paths[-1])
+            postings, buffered = defaultdict[str, array](lambda: array("I")), 0
+
+        with open(output_dir / "docs.jsonl", "wb") as docs_file:
+            for doc_id, document in enumerate(documents):
+                doc_offsets.append(docs_file.tell())
+                docs_file.write((json.dumps(document) + "\n").encode())
+                terms = tokenize(f"{document['title']}\n{document['text']}")
+                doc_lengths.append(len(terms))
+                for term, frequency in Counter(terms).items():
+                    postings[term].extend((doc_id, frequency))
+                buffered += len(set(terms))
+                if buffered >= block_postings:
+                    flush()
+        if buffered or not block_paths:
+            flush()
+
+        vocabulary = dict[str, tuple[int, int]]()  # term -> (first posting, document frequency)
+        with open(output_dir / "postings.bin", "wb") as postings_file:
+            position = 0
+            merged = heapq.merge(*(read_block(path, block_number) for block_number, path in enumerate(block_paths)))
+            for term, blocks in itertools.groupby(merged, key=lambda item: item[0]):
+                document_frequency = 0
+                for _, _, packed in blocks:
+                    postings_file.write(packed)
+                    document_frequency += len(packed) // POSTING.size
+                vocabulary[term] = (position, document_frequency)
+                position += document_frequency
+
+    with open(output_dir / "docs.offsets", "wb") as f:
+        doc_offsets.tofile(f)
+    with open(output_dir / "doc_lengths.bin", "wb") as f:
+        doc_lengths.tofile(f)
+    (output_dir / "vocabulary.json").write_text(json.dumps(vocabulary))
+    return len(doc_lengths)
+
+
+class LocalSearchIndex:
+    def __init__(self, index_dir: Path):
+        self.index_dir = index_dir
+        self.vocabulary = json.loads((index_dir / "vocabulary.json").read_text())
+        self.doc_lengths = array("I", (index_dir / "doc_lengths.bin").read_bytes())
+        self.doc_offsets = array("Q", (index_dir / "docs.offsets").read_bytes())
+        self.average_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 1
+        self._postings = self._map(index_dir / "postings.bin")
+        self._docs = self._map(index_dir / "docs.jsonl")
+        self._links = None
+
+    @staticmethod
+    def _map(path: Path) -> mmap.mmap | bytes:
+        with open(path, "rb") as f:
+            # mmap cannot map empty files.
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if path.stat().st_size else b""
+
+    def document(self, doc_id: int) -> LocalDocument:
+        start = self.doc_offsets[doc_id]
+        return json.loads(self._docs[start : self._docs.find(b"\n", start)])
+
+    def search(self, query: str, max_results: int) -> list[SearchEntry]:
+        terms = set(tokenize(query))
+        scores = defaultdict[int, float](float)
+        for term in terms:
+            if term not in self.vocabulary:
+                continue
+            first, document_frequency = self.vocabulary[term]
+            idf = math.log(1 + (len(self.doc_lengths) - document_frequency + 0.5) / (document_frequency + 0.5))
+            for doc_id, frequency in POSTING.iter_unpack(self._postings[first * POSTING.size : (first + document_frequency) * POSTING.size]):
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.average_length
+                scores[doc_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+
+        entries = list[SearchEntry]()
+        for doc_id, _ in heapq.nlargest(max_results, scores.items(), key=lambda item: item[1]):
+            document = self.document(doc_id)
+            entries.append(SearchEntry(title=document["title"], link=document["link"], snippet=best_snippet(document, terms)))
+        return entries
+
+    def page(self, url: str) -> str | None:
+        """Returns the stored text of a document by URL, so browse also works offline."""
+        if self._links is None:
+            self._links = {canonicalize_url(self.document(doc_id)["link"]): doc_id for doc_id in range(len(self.doc_offsets))}
+        doc_id = self._links.get(canonicalize_url(url))
+        return self.document(doc_id)["text"] if doc_id is not None else None
+
+
+def best_snippet(document: LocalDocument, terms: set[str]) -> str:
+    """The SNIPPET_WORDS-word window of the document text with the most query terms, or the stored snippet if there is no match."""
+    words = document["text"].split()
+    if not words:
+        return document["snippet"] or "(No snippet available)"
+    hits = [1 if set(tokenize(word)) & terms else 0 for word in words]
+    window = sum(hits[:SNIPPET_WORDS])
+    best_start, best_window = 0, window
+    for start in range(1, max(1, len(words) - SNIPPET_WORDS + 1)):
+        window += hits[start + SNIPPET_WORDS - 1] - hits[start - 1]
+        if window > best_window:
+            best_start, best_window = start, window
+    if best_window == 0 and document["snippet"]:
+        return document["snippet"]
+    snippet = re.sub(r"\s+", " ", " ".join(words[best_start : best_start + SNIPPET_WORDS]))
+    return ("..." if best_start > 0 else "") + snippet + ("..." if best_start + SNIPPET_WORDS < len(words) else "")
+
+
+@cache
+def load_index(index_dir: str) -> LocalSearchIndex:
+    return LocalSearchIndex(Path(index_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--trajectories", type=Path, nargs="*", default=[], help="trajectories_*.jsonl files to harvest documents from")
+    parser.add_argument("--jsonl", type=Path, nargs="*", default=[], help="JSONL corpora with title, url and text fields")
+    parser.add_argument("--query", type=str, default=None, help="Run a test query against the built index")
+    args = parser.parse_args()
+
+    if args.trajectories or args.jsonl:
+        num_documents = build_index(itertools.chain(harvest_trajectories(args.trajectories), load_jsonl_documents(args.jsonl)), args.output)
+        print(f"Indexed {num_documents} documents into {args.output}")
+    if args.query:
+        for entry in load_index(args.output.as_posix()).search(args.query, 10):
+            print(entry)
@@ -0,0 +1,186 @@
+"""
+Local stand-in for google.serper.dev/search and scrape.serper.dev, for repeatable benchmarks of evaluate.py under concurrency.
+
+It replays responses recorded from real runs: the search responses and scraped pages that tools.py stores in the SQLite caches under CACHE_DIR (copy them aside to freeze a recording). Queries or URLs that were never recorded fall back to the offline BM25 index if one is given, or else get an empty result / a scrape error. Latency, server errors and 429s can be injected.
+
+Command:
+uv run src/part1/mock_serper.py --port 8000 --latency_ms 300 --throttle_rate 0.05
+
+Then point the tools at it (and disable the client-side caches, or every call after the first is a cache hit):
+SERPER_SEARCH_URL=http://127.0.0.1:8000/search SERPER_SCRAPE_URL=http://127.0.0.1:8000/scrape SERPER_SEARCH_CACHE=0 SERPER_PAGE_CACHE=0 \
+    uv run src/part1/evaluate.py --run_name bench --agent_type browse --max_workers 200
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import zstandard
+from cache import CACHE_DIR, canonicalize_url, normalize_query
+from local_search import LocalSearchIndex
+
+
+class Recordings:
+    """Read-only view of the search and page caches."""
+
+    def __init__(self, cache_dir: Path):
+        self._lock = threading.Lock()
+        self._search = self._connect(cache_dir / "serper.sqlite")
+        self._pages = self._connect(cache_dir / "pages.sqlite")
+
+    @staticmethod
+    def _connect(path: Path) -> sqlite3.Connection | None:
+        if not path.exists():
+            return None
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, query: str, page: int, num: int) -> dict | None:
+        if self._search is None:
+            return None
+        with self._lock:
+            # Prefer the exact request, else any recording of the query with at least as many results.
+            row = self._search.execute(
+                "SELECT response FROM search WHERE query = ? AND page = ? AND num >= ? ORDER BY num != ?, num LIMIT 1",
+                (normalize_query(query), page, num, num),
+            ).fetchone()
+        if row is None:
+            return None
+        response = json.loads(row[0])
+        response["organic"] = response.get("organic", [])[:num]
+        return response
+
+    def page(self, url: str) -> str | None:
+        if self._pages is None:
+            return None
+        with self._lock:
+            row = self._pages.execute(
+                "SELECT bodies.body FROM pages JOIN bodies USING (digest) WHERE pages.url = ?", (canonicalize_url(url),)
+            ).fetchone()
+        return zstandard.decompress(row[0]).decode() if row is not None else None
+
+
+class MockSerperHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockSerperServer"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        server.count("requests")
+        time.sleep(max(0.0, random.gauss(server.latency, server.latency_jitter)))
+
+        if random.random() < server.throttle_rate:
+            server.count("throttled")
+            return self.respond(429, {"message": "Too many requests"}, {"Retry-After": str(server.retry_after)})
+        if random.random() < server.error_rate:
+            server.count("errors")
+            return self.respond(500, {"message": "Internal server error"})
+
+        if self.path.rstrip("/").endswith("/search"):
+            self.respond(200, server.search(body.get("q", ""), body.get("page", 1), body.get("num", 10)))
+        elif self.path.rstrip("/").endswith("/scrape"):
+            markdown = server.page(body.get("url", ""))
+            if markdown is None:
+                self.respond(400, {"message": "Failed to scrape the URL", "statusCode": 400})
+            else:
+                self.respond(200, {"text": markdown, "markdown": markdown, "metadata": {}})
+        else:
+            self.respond(404, {"message": f"Unknown endpoint {self.path}"})
+
+    def respond(self, status: int, payload: dict, headers: dict | None = None):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+class MockSerperServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        recordings: Recordings,
+        index: LocalSearchIndex | None = None,
+        latency_ms: float = 0,
+        latency_jitter_ms: float = 0,
+        error_rate: float = 0,
+        throttle_rate: float = 0,
+        retry_after: float = 1,
+    ):
+        super().__init__(address, MockSerperHandler)
+        self.recordings = recordings
+        self.index = index
+        self.latency = latency_ms / 1000
+        self.latency_jitter = latency_jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.counts = dict[str, int]()
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def search(self, query: str, page: int, num: int) -> dict:
+        response = self.recordings.search(query, page, num)
+        if response is not None:
+            self.count("search_replayed")
+            return response
+        self.count("search_unrecorded")
+        entries = self.index.search(query, page * num)[(page - 1) * num :] if self.index is not None else []
+        return {"searchParameters": {"q": query, "page": page, "num": num}, "organic": [{**entry, "position": i + 1} for i, entry in enumerate(entries)]}
+
+    def page(self, url: str) -> str | None:
+        markdown = self.recordings.page(url)
+        if markdown is not None:
+            self.count("scrape_replayed")
+            return markdown
+        self.count("scrape_unrecorded")
+        return self.index.page(url) if self.index is not None else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recordings", type=Path, default=CACHE_DIR, help="Directory with the serper.sqlite / pages.sqlite caches to replay")
+    parser.add_argument("--local_index", type=Path, default=None, help="Offline BM25 index answering unrecorded requests")
+    parser.add_argument("--latency_ms", type=float, default=0)
+    parser.add_argument("--latency_jitter_ms", type=float, default=0)
+    parser.add_argument("--error_rate", type=float, default=0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--throttle_rate", type=float, default=0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--retry_after", type=float, default=1, help="Retry-After (seconds) sent with the 429s")
+    args = parser.parse_args()
+
+    server = MockSerperServer(
+        (args.host, args.port),
+        Recordings(args.recordings),
+        LocalSearchIndex(args.local_index) if args.local_index else None,
+        args.latency_ms,
+        args.latency_jitter_ms,
+        args.error_rate,
+        args.throttle_rate,
+        args.retry_after,
+    )
+    print(f"Mock Serper listening on http://{args.host}:{args.port} (/search, /scrape)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.counts, indent=2))
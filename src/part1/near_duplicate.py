@@ -0,0 +1,60 @@
+"""
+Lexical near-duplicate detection for search queries: character n-grams of the sorted query words, MinHash signatures and LSH band keys. Used by the search cache to serve rephrasings of an already cached query (reordered words, an added "wikipedia", ...).
+"""
+
+import hashlib
+import random
+import re
+import struct
+import zlib
+from collections import Counter
+
+from text_utils import STOPWORDS
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+# Words agents append to a query without changing what it asks for.
+NOISE_WORDS = {"wiki", "wikipedia", "history"}
+# Stopwords that two near-duplicates may differ by. Others ("is"/"was", "who"/"when", ...) change the question.
+FILLER_WORDS = {"a", "an", "the", "of", "in", "on", "at", "to", "for", "from", "by", "with", "and", "or"}
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(0)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def query_words(query: str) -> list[str]:
+    """The sorted words of the query without noise words, repeated words included ("harry in harry potter" is not "harry potter")."""
+    return sorted(word for word in re.findall(r"\w+", query.lower()) if word not in NOISE_WORDS)
+
+
+def significant_words(query: str) -> Counter[str]:
+    return Counter(word for word in query_words(query) if word not in FILLER_WORDS)
+
+
+def shingles(query: str) -> set[str]:
+    text = f" {' '.join(query_words(query))} "
+    return {text[i : i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def is_near_duplicate(query: str, other: str, threshold: float) -> bool:
+    """The queries must have some content words (not only stopwords) and the same words up to order, noise and filler words: "apollo 11 crew" and "apollo 12 crew", or "who is ..." and "who was ...", are different questions."""
+    if not any(word not in STOPWORDS for word in query_words(query)):
+        return False
+    return significant_words(query) == significant_words(other) and jaccard(shingles(query), shingles(other)) >= threshold
+
+
+def band_keys(query: str) -> list[str]:
+    """LSH keys of the MinHash signature: two queries share a key with high probability when their shingle sets are similar."""
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(query)]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    rows = NUM_PERMUTATIONS // NUM_BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(struct.pack(f"<{rows}Q", *signature[band * rows : (band + 1) * rows]), digest_size=8).hexdigest()
+        for band in range(NUM_BANDS)
+    ]
@@ -0,0 +1,72 @@
+"""
+Compaction of scraped markdown before it reaches the LLM: navigation menus, link URLs, images, citation markers and repeated boilerplate lines are stripped and whitespace is normalised. Lines are processed as a stream, so the page is never copied as a whole more than once.
+"""
+
+import re
+from typing import Iterable, Iterator
+
+LINK_TARGET = r"\((?:[^()\s]|\([^()]*\))*(?:\s+\"[^\"]*\")?\)"
+IMAGE = re.compile(r"!\[[^\]]*\]" + LINK_TARGET)
+LINKED_IMAGE = re.compile(r"\[\s*!\[[^\]]*\]\([^)]*\)\s*\]\([^)]*\)")
+LINK = re.compile(r"\[([^\[\]]*)\]" + LINK_TARGET)
+REFERENCE_LINK = re.compile(r"\[([^\[\]]+)\]\[[^\[\]]*\]")
+LINK_DEFINITION = re.compile(r"^\s*\[[^\]]+\]:\s+\S+.*$")
+AUTOLINK = re.compile(r"<(?:https?|mailto):[^>]+>")
+# Numbers of at most 3 digits, so that linked years ("[1998](/1998)") are kept as text.
+# Letter markers ("word[a]") only in lowercase and attached to the preceding word, link or punctuation, so that "Option [A] or [B]" stays.
+CITATION_MARKER = r"\[(?:\d{1,3}|note \d+|citation needed|clarification needed|edit|update)\]|(?<=[\w)\].,;:!?\"'])(?-i:\[[a-z]\])|\\\[\d+\\\]"
+CITATION = re.compile(CITATION_MARKER, re.IGNORECASE)
+# Citation markers and [edit] links are dropped with their URL, before LINK would unwrap them into "[1]" or "edit".
+CITATION_LINK = re.compile(rf"(?:{CITATION_MARKER}){LINK_TARGET}", re.IGNORECASE)
+HTML_TAGS = "a|abbr|b|big|blockquote|br|caption|center|cite|code|col|div|em|figcaption|figure|font|h[1-6]|hr|i|img|li|ol|p|pre|s|small|span|strong|sub|sup|table|tbody|td|th|thead|tr|u|ul"
+# Known tags whose attributes all have values, so that text such as "a<b and c>d" is left alone.
+HTML_TAG = re.compile(rf"</?(?:{HTML_TAGS})(?:\s+[\w:-]+\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s>]+))*\s*/?>", re.IGNORECASE)
+SPACES = re.compile(r"[ \t ]+")
+
+NAV_MIN_LINKS = 3
+DEDUPLICATE_MIN_CHARS = 30
+
+
+def is_navigation(line: str) -> bool:
+    """Menus, breadcrumbs and link bars: several links and no words outside of them. Table rows are never navigation: their cells are often only links (e.g. a list of winners)."""
+    if line.lstrip().startswith("|"):
+        return False
+    links = LINK.findall(line)
+    return len(links) >= NAV_MIN_LINKS and not re.search(r"\w", LINK.sub("", line))
+
+
+def compact_lines(lines: Iterable[str]) -> Iterator[str]:
+    seen = set[str]()
+    blank = True  # Drops leading blank lines.
+    for line in lines:
+        if LINK_DEFINITION.match(line) or is_navigation(line):
+            continue
+        line = LINKED_IMAGE.sub("", line)
+        line = IMAGE.sub("", line)
+        line = CITATION_LINK.sub("", line)
+        line = LINK.sub(r"\1", line)
+        # Before REFERENCE_LINK, which would read "[1][2]" as a reference link.
+        line = CITATION.sub("", line)
+        line = REFERENCE_LINK.sub(r"\1", line)
+        line = AUTOLINK.sub("", line)
+        line = HTML_TAG.sub("", line)
+        line = SPACES.sub(" ", line).strip()
+
+        # Lines left without any words (e.g. "* " after removing an image) are dropped; table separators are kept.
+        if line and not re.search(r"\w", line) and not re.fullmatch(r"\|?[\s:|-]+\|?", line):
+            continue
+        if not line:
+            if not blank:
+                blank = True
+                yield ""
+            continue
+        if len(line) >= DEDUPLICATE_MIN_CHARS:
+            if line in seen:
+                continue
+            seen.add(line)
+        blank = False
+        yield line
+
+
+def compact_markdown(markdown: str) -> str:
+    return "\n".join(compact_lines(markdown.splitlines())).strip()
@@ -0,0 +1,78 @@
+"""
+Positional keyword index over the lines of a document, used by the `find_in_page` tool to return only the lines that mention the requested terms, with some surrounding context.
+"""
+
+import re
+from collections import defaultdict
+
+FIND_CONTEXT_LINES = 1
+FIND_MAX_MATCHES = 8
+FIND_MAX_LINE_CHARS = 600
+FIND_MAX_CONTEXT_CHARS = 200
+
+WORD = re.compile(r"\w+")
+
+
+def clip(line: str, center: int, max_chars: int) -> str:
+    if len(line) <= max_chars:
+        return line
+    start = max(0, min(center - max_chars // 2, len(line) - max_chars))
+    end = start + max_chars
+    return ("…" if start > 0 else "") + line[start:end] + ("…" if end < len(line) else "")
+
+
+class PositionalIndex:
+    """Maps every lower-cased word to its (line, position) occurrences, so that phrases can be matched by consecutive positions. Blank lines are skipped, so that context lines carry text."""
+
+    def __init__(self, text: str):
+        self.lines = [line for line in text.splitlines() if line.strip()]
+        self.postings = defaultdict[str, set[tuple[int, int]]](set)
+        for line_number, line in enumerate(self.lines):
+            for position, word in enumerate(WORD.findall(line.lower())):
+                self.postings[word].add((line_number, position))
+
+    def match_lines(self, term: str) -> set[int]:
+        words = WORD.findall(term.lower())
+        if not words:
+            return set()
+        return {
+            line_number
+            for line_number, position in self.postings.get(words[0], ())
+            if all((line_number, position + offset) in self.postings.get(word, ()) for offset, word in enumerate(words[1:], 1))
+        }
+
+    def find(self, terms: list[str], max_matches: int = FIND_MAX_MATCHES) -> tuple[list[int], int]:
+        """Returns the best matching lines in document order (most distinct terms first, then earliest), and the total number of matching lines."""
+        matched_terms = defaultdict[int, int](int)
+        for term in set(terms):
+            for line_number in self.match_lines(term):
+                matched_terms[line_number] += 1
+        best = sorted(matched_terms, key=lambda line_number: (-matched_terms[line_number], line_number))
+        return sorted(best[:max_matches]), len(matched_terms)
+
+    def excerpt(self, line_numbers: list[int], terms: list[str], context_lines: int = FIND_CONTEXT_LINES) -> list[str]:
+        """Formats the matching lines with their context, merging overlapping ranges. Long lines are clipped around the first match."""
+        pattern = re.compile("|".join(r"\b" + r"\W+".join(map(re.escape, WORD.findall(term))) + r"\b" for term in terms if WORD.search(term)), re.IGNORECASE)
+        matches = set(line_numbers)
+        ranges = list[list[int]]()
+        for line_number in line_numbers:
+            start, end = max(0, line_number - context_lines), min(len(self.lines) - 1, line_number + context_lines)
+            if ranges and start <= ranges[-1][1] + 1:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+
+        blocks = []
+        for start, end in ranges:
+            lines = []
+            for line_number in range(start, end + 1):
+                line = self.lines[line_number]
+                if line_number in matches:
+                    match = pattern.search(line)
+                    lines.append(clip(line, match.start() if match else 0, FIND_MAX_LINE_CHARS))
+                elif line_number < min(matches & set(range(start, end + 1))):
+                    lines.append(clip(line, len(line), FIND_MAX_CONTEXT_CHARS))
+                else:
+                    lines.append(clip(line, 0, FIND_MAX_CONTEXT_CHARS))
+            blocks.append("\n".join(lines))
+        return blocks
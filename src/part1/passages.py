@@ -0,0 +1,85 @@
+"""
+Question-focused passage extraction for the browse tool: split a scraped page into passages, rank them against the question with BM25 and keep the best ones under a token budget.
+"""
+
+import math
+import re
+from collections import Counter
+
+from text_utils import estimate_tokens, tokenize
+
+PASSAGE_TARGET_TOKENS = 150
+PASSAGE_TOP_K = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def split_passages(content: str, target_tokens: int = PASSAGE_TARGET_TOKENS) -> list[str]:
+    """Groups consecutive paragraphs into passages of roughly `target_tokens`; oversized paragraphs are split at sentence boundaries."""
+    pieces = list[str]()
+    for paragraph in re.split(r"\n\s*\n", content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= 2 * target_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(sentence for sentence in re.split(r"(?<=[.!?])\s+|\n", paragraph) if sentence.strip())
+
+    passages = list[str]()
+    current = list[str]()
+    for piece in pieces:
+        if current and estimate_tokens("\n\n".join([*current, piece])) > target_tokens:
+            passages.append("\n\n".join(current))
+            current = []
+        current.append(piece)
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+def bm25_scores(query: str, passages: list[str]) -> list[float]:
+    query_terms = set(tokenize(query))
+    documents = [Counter(tokenize(passage)) for passage in passages]
+    if not documents or not query_terms:
+        return [0.0] * len(passages)
+
+    average_length = sum(sum(document.values()) for document in documents) / len(documents) or 1
+    document_frequency = Counter(term for document in documents for term in query_terms if term in document)
+    scores = list[float]()
+    for document in documents:
+        length = sum(document.values())
+        score = 0.0
+        for term in query_terms:
+            frequency = document[term]
+            if frequency == 0:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        scores.append(score)
+    return scores
+
+
+def select_passages(content: str, question: str, token_budget: int, top_k: int = PASSAGE_TOP_K) -> str:
+    """Returns the `top_k` passages most relevant to `question` that fit in `token_budget`, in page order, with a header saying how much was left out."""
+    if estimate_tokens(content) <= token_budget:
+        return content
+
+    passages = split_passages(content)
+    scores = bm25_scores(question, passages)
+    # Ties (e.g. no overlap at all) keep page order, so the lead of the page wins.
+    ranking = sorted(range(len(passages)), key=lambda i: -scores[i])
+
+    selected = list[int]()
+    used_tokens = 0
+    for i in ranking:
+        if len(selected) == top_k:
+            break
+        passage_tokens = estimate_tokens(passages[i])
+        if used_tokens + passage_tokens > token_budget:
+            continue
+        selected.append(i)
+        used_tokens += passage_tokens
+
+    header = f"[Showing {len(selected)} of {len(passages)} passages most relevant to the question (~{used_tokens} of ~{estimate_tokens(content)} tokens). If the answer is not here, try another page or a more specific search.]"
+    return "\n\n".join([header, *(passages[i] for i in sorted(selected))])
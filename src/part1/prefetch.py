@@ -0,0 +1,129 @@
+"""
+Speculative prefetch for the browse agent: when `search` returns, the top result links are scraped in the background into a small in-memory buffer, so that a later `browse` of one of them does not wait for Serper.
+"""
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+import run_stats
+from cache import canonicalize_url
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PREFETCH_MAX_BYTES = int(os.getenv("PREFETCH_MAX_BYTES", 64 * 1024**2))
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", 16))
+
+
+class Prefetcher:
+    """Bounded LRU buffer of prefetched pages. Pages evicted (or left over at close) without ever being browsed count as wasted bytes."""
+
+    def __init__(
+        self,
+        fetch: Callable[[str], str | None],
+        afetch: Callable[[str], Awaitable[str | None]],
+        max_bytes: int = PREFETCH_MAX_BYTES,
+    ):
+        self.fetch = fetch
+        self.afetch = afetch
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pages = OrderedDict[str, tuple[str, bool]]()  # key -> (content, browsed)
+        self._bytes = 0
+        self._in_flight = set[str]()
+        self._browsed_in_flight = set[str]()
+        self._tasks = set[asyncio.Task]()
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS)
+
+    def _claim(self, url: str) -> str | None:
+        key = canonicalize_url(url)
+        with self._lock:
+            if key in self._pages or key in self._in_flight:
+                return None
+            self._in_flight.add(key)
+        run_stats.incr("prefetch.requested")
+        return key
+
+    def _store(self, key: str, content: str | None):
+        with self._lock:
+            self._in_flight.discard(key)
+            browsed = key in self._browsed_in_flight
+            self._browsed_in_flight.discard(key)
+            if content is None:
+                return
+            size = len(content.encode())
+            self._pages[key] = (content, browsed)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._pages:
+                _, (evicted, browsed) = self._pages.popitem(last=False)
+                self._bytes -= len(evicted.encode())
+                if not browsed:
+                    run_stats.incr("prefetch.wasted_bytes", len(evicted.encode()))
+        run_stats.incr("prefetch.fetched")
+        run_stats.incr("prefetch.fetched_bytes", size)
+
+    def prefetch(self, urls: list[str]):
+        def run(url: str, key: str):
+            try:
+                self._store(key, self.fetch(url))
+            except Exception:
+                self._store(key, None)
+
+        for url in urls:
+            key = self._claim(url)
+            if key is not None:
+                self._executor.submit(run, url, key)
+
+    def aprefetch(self, urls: list[str]):
+        async def run(url: str, key: str):
+            try:
+                self._store(key, await self.afetch(url))
+            except Exception:
+                self._store(key, None)
+
+        for url in urls:
+            key = self._claim(url)
+            if key is not None:
+                task = asyncio.create_task(run(url, key))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def get(self, url: str) -> str | None:
+        """Returns the prefetched page, if any. A page still being prefetched is not waited for here; the caller's own fetch joins it via single-flight."""
+        key = canonicalize_url(url)
+        with self._lock:
+            if key in self._in_flight:
+                self._browsed_in_flight.add(key)
+                run_stats.incr("prefetch.in_flight_hit")
+                return None
+            if key not in self._pages:
+                return None
+            content, browsed = self._pages[key]
+            self._pages[key] = (content, True)
+            self._pages.move_to_end(key)
+        if not browsed:
+            run_stats.incr("prefetch.hit")
+            run_stats.incr("prefetch.hit_bytes", len(content.encode()))
+        return content
+
+    def close(self):
+        """Waits for outstanding prefetches and counts never-browsed pages as wasted."""
+        self._executor.shutdown(wait=True)
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS)
+        self._record_leftovers()
+
+    async def aclose(self):
+        await asyncio.gather(*self._tasks)
+        self._record_leftovers()
+
+    def _record_leftovers(self):
+        with self._lock:
+            for content, browsed in self._pages.values():
+                if not browsed:
+                    run_stats.incr("prefetch.wasted_bytes", len(content.encode()))
+            self._pages.clear()
+            self._bytes = 0
@@ -0,0 +1,176 @@
+"""
+Shared limiters for the external APIs (Serper search, Serper scrape, DeepSeek chat). Each upstream gets a token bucket capping the request rate and an AIMD window capping the requests in flight: the window starts in slow start (+1 per success, i.e. doubling every round of calls) until the first throttle, then grows by about one per round while calls succeed and halves on throttling, so throughput settles at what the provider actually allows instead of collapsing into retry storms.
+"""
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+import run_stats
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+def parse_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    value = (headers or {}).get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Slot:
+    """Outcome of one call made under a limiter. Calls that are neither marked successful nor throttled leave the window unchanged."""
+
+    def __init__(self):
+        self.outcome: str | None = None
+        self.retry_after: float | None = None
+        self.attempt = 0
+
+    def success(self):
+        self.outcome = "success"
+
+    def throttle(self, retry_after: float | None = None, attempt: int = 0):
+        self.outcome = "throttled"
+        self.retry_after = retry_after
+        self.attempt = attempt
+
+
+class UpstreamLimiter:
+    """Threads and coroutines waiting for a free slot are woken when one is released; waits for the rate or a Retry-After block are timed. A rate of 0 means no rate cap, e.g. for a plain bound on calls in flight."""
+
+    def __init__(self, name: str, rate: float, max_window: int, initial_window: int = 4, min_window: int = 1):
+        self.name = name
+        self.rate = rate
+        self.max_window = max_window
+        self.min_window = min_window
+        self.window = float(min(initial_window, max_window))
+        self.slow_start = True
+        self.burst = max(1.0, rate)
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._in_flight = 0
+        self._lock = threading.Condition()
+        self._async_waiters = list[tuple[asyncio.AbstractEventLoop, asyncio.Future]]()
+
+    def _try_acquire(self) -> float:
+        """Takes a slot and returns 0, or returns how long to wait before trying again (math.inf: until a slot is released). Must hold the lock."""
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._in_flight >= int(self.window):
+            return math.inf
+        if self.rate > 0 and self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        if self.rate > 0:
+            self._tokens -= 1
+        self._in_flight += 1
+        return 0.0
+
+    def acquire(self):
+        with self._lock:
+            while (delay := self._try_acquire()) > 0:
+                self._lock.wait(None if delay == math.inf else delay)
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                delay = self._try_acquire()
+                if delay == 0:
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter[1]], timeout=None if delay == math.inf else delay)
+            finally:
+                with self._lock:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def _wake(self):
+        """Wakes every waiter to retry. Must hold the lock."""
+        self._lock.notify_all()
+        for loop, future in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+            except RuntimeError:  # The loop is closed.
+                pass
+        self._async_waiters.clear()
+
+    def release(self, slot: Slot):
+        with self._lock:
+            self._in_flight -= 1
+            if slot.outcome == "success":
+                # Slow start: +1 per success until the first throttle. Then additive increase: about +1 per window's worth of successful calls.
+                self.window = min(float(self.max_window), self.window + (1 if self.slow_start else 1 / self.window))
+            elif slot.outcome == "throttled":
+                self.slow_start = False
+                self.window = max(float(self.min_window), self.window / 2)
+                delay = slot.retry_after if slot.retry_after is not None else backoff_delay(slot.attempt)
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                run_stats.incr(f"{self.name}.throttled")
+            self._wake()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+
+search_limiter = UpstreamLimiter(
+    "serper_search",
+    rate=float(os.getenv("SERPER_SEARCH_RATE", 50)),
+    max_window=int(os.getenv("SERPER_SEARCH_MAX_CONCURRENCY", 64)),
+    initial_window=int(os.getenv("SERPER_SEARCH_INITIAL_CONCURRENCY", 4)),
+)
+scrape_limiter = UpstreamLimiter(
+    "serper_scrape",
+    rate=float(os.getenv("SERPER_SCRAPE_RATE", 20)),
+    max_window=int(os.getenv("SERPER_SCRAPE_MAX_CONCURRENCY", 64)),
+    initial_window=int(os.getenv("SERPER_SCRAPE_INITIAL_CONCURRENCY", 4)),
+)
+chat_limiter = UpstreamLimiter(
+    "deepseek_chat",
+    rate=float(os.getenv("DEEPSEEK_CHAT_RATE", 50)),
+    max_window=int(os.getenv("DEEPSEEK_CHAT_MAX_CONCURRENCY", 200)),
+    initial_window=int(os.getenv("DEEPSEEK_CHAT_INITIAL_CONCURRENCY", 4)),
+)
@@ -0,0 +1,24 @@
+"""
+Process-wide counters for one evaluation run (cache hits, network calls, ...). The tools increment them and evaluate.py reports them.
+"""
+
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counters = Counter[str]()
+
+
+def incr(name: str, amount: int | float = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> dict[str, int | float]:
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -1,36 +1,75 @@
-from typing import Annotated, Literal, TypedDict
+from typing import Annotated, Literal, NotRequired, TypedDict
 
 from langgraph.graph import MessagesState
 
 
 class Action(TypedDict):
     action: str
+    latency_seconds: NotRequired[float]
 
 
 class Step(TypedDict):
     step_number: int
     actions: list[Action]
+    prompt_cache_hit_tokens: NotRequired[int]
+    prompt_cache_miss_tokens: NotRequired[int]
+    context_reclaimed_tokens: NotRequired[int]
+    llm_seconds: NotRequired[float]
+    tool_seconds: NotRequired[float]
+
+
+# Step fields reported by each of the parallel tool calls of a step, of which the merged step keeps the largest.
+MAX_STEP_FIELDS = {"tool_seconds"}
+
+
+def merge_step_fields(fields: dict, new_fields: dict):
+    for key, value in new_fields.items():
+        fields[key] = max(fields[key], value) if key in MAX_STEP_FIELDS and key in fields else value
 
 
 def step_reducer(old_steps: list[Step], new_steps: list[Step]):
     merged_steps = list[Step]()
     mapping = dict[int, list[Action]]()
+    fields = dict[int, dict]()  # Step fields other than the actions, e.g. the LLM telemetry set by the agent node.
     for old_step in old_steps:
         mapping.setdefault(old_step["step_number"], []).extend(old_step["actions"])
+        merge_step_fields(fields.setdefault(old_step["step_number"], {}), {key: value for key, value in old_step.items() if key not in ("step_number", "actions")})
     for new_step in new_steps:
         mapping.setdefault(new_step["step_number"], []).extend(new_step["actions"])
+        merge_step_fields(fields.setdefault(new_step["step_number"], {}), {key: value for key, value in new_step.items() if key not in ("step_number", "actions")})
 
     for step_number in sorted(list(mapping.keys())):
-        merged_steps.append(Step(step_number=step_number, actions=mapping[step_number]))
+        merged_steps.append(Step(step_number=step_number, actions=mapping[step_number], **fields[step_number]))
 
     return merged_steps
 
 
+class Usage(TypedDict, total=False):
+    llm_calls: int
+    input_tokens: int
+    output_tokens: int
+    cache_hit_tokens: int
+
+
+def usage_reducer(old_usage: Usage, new_usage: Usage) -> Usage:
+    merged_usage = Usage(**old_usage)
+    for key, value in new_usage.items():
+        merged_usage[key] = merged_usage.get(key, 0) + value
+    return merged_usage
+
+
+def answer_reducer(old_answer: str | None, new_answer: str | None) -> str | None:
+    """The first answer wins, e.g. when one step makes several submit_answer calls."""
+    return old_answer if old_answer is not None else new_answer
+
+
 class BaseAgentState(MessagesState):
     current_step: int
     steps: Annotated[list[Step], step_reducer]
+    usage: Annotated[Usage, usage_reducer]
     question: str
-    answer: str | None
+    answer: Annotated[str | None, answer_reducer]
+    budget_exhausted: NotRequired[bool]
 
 
 class SearchEntry(TypedDict):
@@ -39,13 +78,37 @@ class SearchEntry(TypedDict):
     snippet: str
 
 
+class SearchFeatures(TypedDict, total=False):
+    approximate_query: str
+    answer_box: dict[str, str]
+    knowledge_graph: dict[str, str]
+    people_also_ask: list[dict[str, str]]
+    related_searches: list[str]
+
+
 class SearchAction(Action):
     action: Literal["search"]
     query: str
     num_docs_requested: int
     retrieved_documents: list[SearchEntry]
+    features: NotRequired[SearchFeatures]
+    deduplicated_documents: NotRequired[int]
+    deduplicated_tokens: NotRequired[int]
 
 class BrowseAction(Action):
     action: Literal["browse"]
     url: str
-    browsed_content: str
\ No newline at end of file
+    browsed_content: str
+    content_tokens: NotRequired[int]
+    compacted_tokens: NotRequired[int]
+    returned_tokens: NotRequired[int]
+    page: NotRequired[int]
+    num_pages: NotRequired[int]
+
+
+class FindInPageAction(Action):
+    action: Literal["find_in_page"]
+    url: str
+    terms: list[str]
+    num_matches: int
+    found_content: str
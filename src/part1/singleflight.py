@@ -0,0 +1,72 @@
+"""
+Single-flight coalescing for the Serper tools: concurrent calls with the same key share one in-flight fetch instead of each going to the network.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Hashable
+
+import run_stats
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = dict[Hashable, _Call]()
+        self._async_calls = dict[tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future]()
+
+    def do[T](self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            run_stats.incr(f"{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado[T](self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop_key = (asyncio.get_running_loop(), key)
+        future = self._async_calls.get(loop_key)
+        if future is not None:
+            run_stats.incr(f"{self.name}.coalesced")
+            # Shielded so that a cancelled follower does not cancel the leader's fetch.
+            return await asyncio.shield(future)
+
+        future = self._async_calls[loop_key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Marks it retrieved, so it is not logged when there were no followers.
+            raise
+        finally:
+            del self._async_calls[loop_key]
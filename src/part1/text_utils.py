@@ -0,0 +1,23 @@
+"""
+Small text helpers shared by the tools: a rough token estimate and a word tokenizer for lexical ranking.
+"""
+
+import math
+import re
+
+CHARS_PER_TOKEN = 4
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "has", "have", "how",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "when",
+    "where", "which", "who", "whom", "why", "with",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, model-agnostic token estimate (~4 characters per token), good enough for budgeting."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def tokenize(text: str) -> list[str]:
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS]
@@ -0,0 +1,58 @@
+"""
+Execution of the tool calls of one agent step. ToolNode already runs the calls of an AIMessage concurrently (a thread per call in the sync driver, asyncio.gather in the async one); the wrappers below cap the tool calls in flight across the whole run and time each call. The latency is written to the action and, as `tool_seconds`, to its step: step_reducer keeps the slowest call, i.e. the wall time of the step's parallel calls.
+"""
+
+import dataclasses
+import os
+import time
+from typing import Awaitable, Callable
+
+import run_stats
+from dotenv import load_dotenv
+from langchain_core.messages import ToolMessage
+from langgraph.prebuilt import ToolNode
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+from rate_limit import UpstreamLimiter
+
+load_dotenv()
+
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", 128))
+# A fixed window with no rate cap: slots are never marked successful or throttled, so the window does not move.
+tool_calls_limit = UpstreamLimiter("tool_calls", rate=0, max_window=TOOL_CALL_CONCURRENCY, initial_window=TOOL_CALL_CONCURRENCY)
+
+
+def with_latency(result: ToolMessage | Command, seconds: float) -> ToolMessage | Command:
+    """Adds the latency to the actions and steps recorded by a tool's Command; other results are returned as is."""
+    run_stats.incr("tools.calls")
+    run_stats.incr("tools.seconds", seconds)
+    if not isinstance(result, Command) or not isinstance(result.update, dict) or "steps" not in result.update:
+        return result
+    steps = [
+        {
+            **step,
+            "actions": [{**action, "latency_seconds": round(seconds, 3)} for action in step["actions"]],
+            "tool_seconds": round(seconds, 3),
+        }
+        for step in result.update["steps"]
+    ]
+    return dataclasses.replace(result, update={**result.update, "steps": steps})
+
+
+def timed_tool_call(request: ToolCallRequest, execute: Callable[[ToolCallRequest], ToolMessage | Command]) -> ToolMessage | Command:
+    # Timed from before the wait for a slot, so that the step latency includes queueing.
+    started = time.monotonic()
+    with tool_calls_limit.slot():
+        result = execute(request)
+    return with_latency(result, time.monotonic() - started)
+
+
+async def atimed_tool_call(request: ToolCallRequest, execute: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]]) -> ToolMessage | Command:
+    started = time.monotonic()
+    async with tool_calls_limit.aslot():
+        result = await execute(request)
+    return with_latency(result, time.monotonic() - started)
+
+
+def create_tool_node(tools: list) -> ToolNode:
+    return ToolNode(tools, wrap_tool_call=timed_tool_call, awrap_tool_call=atimed_tool_call)
@@ -1,23 +1,69 @@
-import json
+import asyncio
 import math
 import os
 import re
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import http_client
+import httpx
+import run_stats
+from api_keys import NoApiKeyError, serper_keys
+from cache import CACHE_DIR, canonicalize_url, normalize_query, page_store, search_cache
+from documents import Document, documents
 from dotenv import load_dotenv
+from hedging import CircuitBreaker, Hedger
 from langchain.messages import ToolMessage
-from langchain.tools import ToolRuntime, tool
+from langchain.tools import ToolRuntime
+from langchain_core.tools import StructuredTool
 from langgraph.types import Command
-from schema import BrowseAction, SearchAction, SearchEntry, Step
+from local_search import LocalSearchIndex, load_index
+from page_compaction import compact_markdown
+from passages import select_passages
+from prefetch import Prefetcher
+from rate_limit import scrape_limiter, search_limiter
+from schema import BrowseAction, FindInPageAction, SearchAction, SearchEntry, SearchFeatures, Step
+from singleflight import SingleFlight
+from text_utils import estimate_tokens
 
 load_dotenv()
 
-SERPER_SEARCH_URL = "https://google.serper.dev/search"
-SERPER_SCRAPE_URL = "https://scrape.serper.dev"
+SERPER_SEARCH_URL = os.getenv("SERPER_SEARCH_URL", "https://google.serper.dev/search")
+SERPER_SCRAPE_URL = os.getenv("SERPER_SCRAPE_URL", "https://scrape.serper.dev")
 SERPER_ENTRIIES_IN_PAGE = 10
+SERPER_SEARCH_USE_NUM = os.getenv("SERPER_SEARCH_USE_NUM", "1") != "0"
+BROWSE_TOKEN_BUDGET = 2000
+MAX_MULTI_SEARCH_QUERIES = 5
+MAX_FIND_TERMS = 10
+MAX_PEOPLE_ALSO_ASK = 3
+MAX_RELATED_SEARCHES = 5
+LOCAL_INDEX_DIR = CACHE_DIR / "local_index"
+SCRAPE_HEDGING = os.getenv("SCRAPE_HEDGING", "1") != "0"
 
+_page_executor = ThreadPoolExecutor(max_workers=8)
+_query_executor = ThreadPoolExecutor(max_workers=16)
+search_flight = SingleFlight("search_singleflight")
+scrape_flight = SingleFlight("scrape_singleflight")
+scrape_hedger = Hedger("scrape")
+scrape_breaker = CircuitBreaker("scrape_circuit")
 
-@tool
-def submit_answer(content: str, runtime: ToolRuntime):
+
+class SearchApiError(RuntimeError):
+    """Serper answered with an error (after retries) instead of a result list, which may be empty."""
+
+
+def search_response(response: httpx.Response) -> dict:
+    if response.status_code >= 400:
+        raise SearchApiError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response.json()
+
+
+def search_error_message(e: Exception) -> str:
+    run_stats.incr("search.error")
+    return f"The search failed because of an error of the search service, not because there are no results ({type(e).__name__}: {e}). Please retry the search, or continue with the information you already have."
+
+
+def run_submit_answer(content: str, runtime: ToolRuntime):
     """Provide the final answer. Please make sure the answer is as concise as possible, and wrap it in <answer>...</answer> tag,
 
     Args:
@@ -47,21 +93,236 @@ def submit_answer(content: str, runtime: ToolRuntime):
         }
     )
 
-def search_api_call(query: str, max_results: int):
-    pages = math.ceil(max_results / SERPER_ENTRIIES_IN_PAGE)
+
+async def arun_submit_answer(content: str, runtime: ToolRuntime):
+    return run_submit_answer(content, runtime)
+
+
+submit_answer = StructuredTool.from_function(func=run_submit_answer, coroutine=arun_submit_answer, name="submit_answer")
+
+
+def cached_search_page(query: str, page: int, num: int) -> dict | None:
+    """An exact cache hit, or else the response of a cached near-duplicate query, marked with "approximateQuery"."""
+    if search_cache is None:
+        return None
+    cached = search_cache.get(query, page, num)
+    if cached is not None:
+        return cached
+    similar = search_cache.get_similar(query, page, num)
+    if similar is not None:
+        similar_query, response = similar
+        return {**response, "approximateQuery": similar_query}
+    return None
+
+
+def fetch_search_page(query: str, page: int, num: int) -> dict:
+    cached = cached_search_page(query, page, num)
+    if cached is not None:
+        return cached
+
+    payload = {"q": query, "page": page, "num": num}
+    headers = {"Content-Type": "application/json"}
+    response = search_response(http_client.post(SERPER_SEARCH_URL, payload, headers, search_limiter, serper_keys))
+    run_stats.incr("search_api.request")
+    if search_cache is not None and "organic" in response:
+        search_cache.put(query, page, num, response)
+    return response
+
+
+async def afetch_search_page(query: str, page: int, num: int) -> dict:
+    cached = cached_search_page(query, page, num)
+    if cached is not None:
+        return cached
+
+    payload = {"q": query, "page": page, "num": num}
+    headers = {"Content-Type": "application/json"}
+    response = search_response(await http_client.apost(SERPER_SEARCH_URL, payload, headers, search_limiter, serper_keys))
+    run_stats.incr("search_api.request")
+    if search_cache is not None and "organic" in response:
+        search_cache.put(query, page, num, response)
+    return response
+
+
+def search_page_api_call(query: str, page: int, num: int) -> dict:
+    return search_flight.do((normalize_query(query), page, num), lambda: fetch_search_page(query, page, num))
+
+
+async def asearch_page_api_call(query: str, page: int, num: int) -> dict:
+    return await search_flight.ado((normalize_query(query), page, num), lambda: afetch_search_page(query, page, num))
+
+
+def parse_search_responses(responses: list[dict], max_results: int) -> list[SearchEntry]:
     all_entries = list[SearchEntry]()
-    for page in range(1, pages + 1):
-        payload = json.dumps({"q": query, "page": page})
-        headers = {"X-API-KEY": os.getenv("SERPER_API_KEY"),"Content-Type": "application/json"}
-        response = requests.request("POST", SERPER_SEARCH_URL, headers=headers, data=payload)
-        limit = (SERPER_ENTRIIES_IN_PAGE if page <= pages else max_results % SERPER_ENTRIIES_IN_PAGE)
-        entries = [{"title": entry["title"], "link": entry["link"], "snippet": entry.get("snippet", "(No snippet available)")} for entry in response.json()["organic"][:limit]]
+    for response in responses:
+        if "organic" not in response:
+            raise SearchApiError(response.get("message") or f"no organic results in the response (keys: {', '.join(response) or 'none'})")
+        entries = [{"title": entry["title"], "link": entry["link"], "snippet": entry.get("snippet", "(No snippet available)")} for entry in response.get("organic", [])]
         all_entries.extend(entries)
-    return all_entries
+    return all_entries[:max_results]
+
+
+def parse_search_features(response: dict) -> SearchFeatures:
+    """Keeps the text fields of the answer box, knowledge graph, "people also ask" and related searches of a Serper response, and the near-duplicate query it was served for, if any."""
+    features = SearchFeatures()
+    if approximate_query := response.get("approximateQuery"):
+        features["approximate_query"] = approximate_query
+    if answer_box := response.get("answerBox"):
+        answer_box = {key: str(answer_box[key]) for key in ("title", "answer", "snippet", "date", "link") if answer_box.get(key)}
+        if answer_box:
+            features["answer_box"] = answer_box
+    if knowledge_graph := response.get("knowledgeGraph"):
+        attributes = knowledge_graph.get("attributes") or {}
+        knowledge_graph = {key: str(knowledge_graph[key]) for key in ("title", "type", "description") if knowledge_graph.get(key)}
+        knowledge_graph.update({key: str(value) for key, value in attributes.items() if value})
+        if knowledge_graph:
+            features["knowledge_graph"] = knowledge_graph
+    if people_also_ask := response.get("peopleAlsoAsk"):
+        features["people_also_ask"] = [{key: str(entry[key]) for key in ("question", "snippet", "link") if entry.get(key)} for entry in people_also_ask[:MAX_PEOPLE_ALSO_ASK] if entry.get("question")]
+    if related_searches := response.get("relatedSearches"):
+        features["related_searches"] = [entry["query"] for entry in related_searches[:MAX_RELATED_SEARCHES] if entry.get("query")]
+    return SearchFeatures(**{key: value for key, value in features.items() if value})
+
+
+def search_api_call(query: str, max_results: int) -> tuple[list[SearchEntry], SearchFeatures]:
+    pages = math.ceil(max_results / SERPER_ENTRIIES_IN_PAGE)
+    if SERPER_SEARCH_USE_NUM:
+        # One round trip: Serper accepts the result count directly in multiples of a page.
+        responses = [search_page_api_call(query, 1, pages * SERPER_ENTRIIES_IN_PAGE)]
+    else:
+        responses = list(_page_executor.map(lambda page: search_page_api_call(query, page, SERPER_ENTRIIES_IN_PAGE), range(1, pages + 1)))
+    return parse_search_responses(responses, max_results), parse_search_features(responses[0])
+
+
+async def asearch_api_call(query: str, max_results: int) -> tuple[list[SearchEntry], SearchFeatures]:
+    pages = math.ceil(max_results / SERPER_ENTRIIES_IN_PAGE)
+    if SERPER_SEARCH_USE_NUM:
+        responses = [await asearch_page_api_call(query, 1, pages * SERPER_ENTRIIES_IN_PAGE)]
+    else:
+        responses = await asyncio.gather(*(asearch_page_api_call(query, page, SERPER_ENTRIIES_IN_PAGE) for page in range(1, pages + 1)))
+    return parse_search_responses(responses, max_results), parse_search_features(responses[0])
+
+
+def local_index(runtime: ToolRuntime) -> LocalSearchIndex | None:
+    """The offline index when the run uses the local search backend, None for Serper."""
+    configurable = runtime.config["configurable"]
+    if configurable.get("search_backend", "serper") == "local":
+        return load_index(configurable.get("local_index", LOCAL_INDEX_DIR.as_posix()))
+    return None
+
+
+def search_backend_call(query: str, max_results: int, runtime: ToolRuntime) -> tuple[list[SearchEntry], SearchFeatures]:
+    index = local_index(runtime)
+    if index is not None:
+        run_stats.incr("local_search.query")
+        return index.search(query, max_results), SearchFeatures()
+    return search_api_call(query, max_results)
+
+
+async def asearch_backend_call(query: str, max_results: int, runtime: ToolRuntime) -> tuple[list[SearchEntry], SearchFeatures]:
+    index = local_index(runtime)
+    if index is not None:
+        run_stats.incr("local_search.query")
+        return index.search(query, max_results), SearchFeatures()
+    return await asearch_api_call(query, max_results)
+
+
+def format_entry(entry: SearchEntry, seen_step: int | None = None) -> str:
+    if seen_step is not None:
+        return "<Entry>\n"+ f"<Title>{entry["title"]}</Title>\n"+ f"<Link>{entry["link"]}</Link>\n"+ f"<Snippet>(seen in step {seen_step})</Snippet>\n"+ "</Entry>\n"
+    return "<Entry>\n"+ f"<Title>{entry["title"]}</Title>\n"+ f"<Link>{entry["link"]}</Link>\n"+ f"<Snippet>{entry["snippet"]}</Snippet>\n"+ "</Entry>\n"
 
 
-@tool
-def search(query: str, max_results: int, runtime: ToolRuntime):
+def format_features(features: SearchFeatures, query: str | None = None) -> str:
+    """Renders the direct-answer sections of a search above its entries. `query` labels them in merged multi_search output."""
+    sections = []
+    if "approximate_query" in features:
+        sections.append(f"<ApproximateResults>No exact results are cached; these are the cached results of the similar query \"{features["approximate_query"]}\".</ApproximateResults>\n")
+    if "answer_box" in features:
+        sections.append("<AnswerBox>\n" + "".join(f"{key.capitalize()}: {value}\n" for key, value in features["answer_box"].items()) + "</AnswerBox>\n")
+    if "knowledge_graph" in features:
+        sections.append("<KnowledgeGraph>\n" + "".join(f"{key[0].upper() + key[1:]}: {value}\n" for key, value in features["knowledge_graph"].items()) + "</KnowledgeGraph>\n")
+    if "people_also_ask" in features:
+        questions = [f"<Question>{entry["question"]}</Question>\n" + (f"<Answer>{entry["snippet"]}</Answer>\n" if "snippet" in entry else "") for entry in features["people_also_ask"]]
+        sections.append("<PeopleAlsoAsk>\n" + "".join(questions) + "</PeopleAlsoAsk>\n")
+    if "related_searches" in features:
+        sections.append(f"<RelatedSearches>{"; ".join(features["related_searches"])}</RelatedSearches>\n")
+    if sections and query is not None:
+        sections.insert(0, f"<Query>{query}</Query>\n")
+    return "".join(sections)
+
+
+def search_features(features: SearchFeatures, runtime: ToolRuntime) -> SearchFeatures:
+    if not runtime.config["configurable"].get("search_features", True):
+        return SearchFeatures(**{key: value for key, value in features.items() if key == "approximate_query"})
+    for key in features:
+        run_stats.incr(f"search.features.{key}")
+    return features
+
+
+def seen_step(entry: SearchEntry, seen: dict[str, int]) -> int | None:
+    """The step that already showed this entry, if a back-reference to it is shorter than its snippet."""
+    step = seen.get(entry["link"])
+    if step is None or len(entry["snippet"]) <= len(f"(seen in step {step})"):
+        return None
+    return step
+
+
+def format_entries(entries: list[SearchEntry], seen: dict[str, int] | None = None) -> str:
+    """Links in `seen` were already shown earlier in the trajectory and are rendered as back-references without their snippet."""
+    seen = seen or {}
+    formatted_entries = [format_entry(entry, seen_step(entry, seen)) for entry in entries]
+    return f"<Entries>\n{''.join(formatted_entries)}</Entries>\n"
+
+
+def seen_links(runtime: ToolRuntime) -> dict[str, int]:
+    """Maps the links shown by earlier search calls of this trajectory to the step that first showed them."""
+    if not runtime.config["configurable"].get("dedup_search_results", True):
+        return {}
+    seen = dict[str, int]()
+    for step in runtime.state.get("steps", []):
+        if step["step_number"] >= runtime.state["current_step"]:
+            continue
+        for action in step["actions"]:
+            if action["action"] == "search":
+                for entry in action["retrieved_documents"]:
+                    seen.setdefault(entry["link"], step["step_number"])
+    return seen
+
+
+def record_dedup(action: SearchAction, entries: list[SearchEntry], seen: dict[str, int]):
+    repeated = [entry for entry in entries if seen_step(entry, seen) is not None]
+    saved_tokens = sum(estimate_tokens(format_entry(entry)) - estimate_tokens(format_entry(entry, seen_step(entry, seen))) for entry in repeated)
+    action["deduplicated_documents"] = len(repeated)
+    action["deduplicated_tokens"] = saved_tokens
+    run_stats.incr("search.deduplicated_documents", len(repeated))
+    run_stats.incr("search.deduplicated_tokens", saved_tokens)
+
+
+def maybe_prefetch(entries: list[SearchEntry], runtime: ToolRuntime, use_async: bool = False):
+    prefetch_top_n = runtime.config["configurable"].get("prefetch_top_n", 0)
+    if prefetch_top_n > 0 and local_index(runtime) is None:
+        links = [entry["link"] for entry in entries[:prefetch_top_n]]
+        prefetcher.aprefetch(links) if use_async else prefetcher.prefetch(links)
+
+
+def search_command(query: str, max_results: int, entries: list[SearchEntry], features: SearchFeatures, runtime: ToolRuntime):
+    seen = seen_links(runtime)
+    features = search_features(features, runtime)
+    formatted_entries = format_features(features) + format_entries(entries, seen)
+    action = SearchAction(action="search", query=query, num_docs_requested=max_results, retrieved_documents=entries)
+    if features:
+        action["features"] = features
+    record_dedup(action, entries, seen)
+
+    return Command(
+        update={
+            "messages": [ToolMessage(content=formatted_entries, tool_call_id=runtime.tool_call_id)],
+            "steps": [Step(step_number=runtime.state["current_step"],actions=[action])]
+        }
+    )
+
+
+def run_search(query: str, max_results: int, runtime: ToolRuntime):
     """Search the web for the given query.
 
     Args:
@@ -71,44 +332,389 @@ def search(query: str, max_results: int, runtime: ToolRuntime):
 
     if max_results > 30:
         return f"The maximum number of results is 30, but got {max_results}. Please reduce the number of results."
+    if max_results < 1:
+        return f"The number of results must be at least 1, but got {max_results}."
+
+    try:
+        entries, features = search_backend_call(query, max_results, runtime)
+    except (SearchApiError, NoApiKeyError, httpx.TransportError) as e:
+        return search_error_message(e)
+    maybe_prefetch(entries, runtime)
+    return search_command(query, max_results, entries, features, runtime)
+
+
+async def arun_search(query: str, max_results: int, runtime: ToolRuntime):
+    if max_results > 30:
+        return f"The maximum number of results is 30, but got {max_results}. Please reduce the number of results."
+    if max_results < 1:
+        return f"The number of results must be at least 1, but got {max_results}."
+
+    try:
+        entries, features = await asearch_backend_call(query, max_results, runtime)
+    except (SearchApiError, NoApiKeyError, httpx.TransportError) as e:
+        return search_error_message(e)
+    maybe_prefetch(entries, runtime, use_async=True)
+    return search_command(query, max_results, entries, features, runtime)
+
 
-    entries = search_api_call(query, max_results)
-    formatted_entries = []
-    for entry in entries:
-        formatted_entries.append("<Entry>\n"+ f"<Title>{entry["title"]}</Title>\n"+ f"<Link>{entry["link"]}</Link>\n"+ f"<Snippet>{entry["snippet"]}</Snippet>\n"+ "</Entry>\n")
-    formatted_entries = f"<Entries>\n{''.join(formatted_entries)}</Entries>\n"
+search = StructuredTool.from_function(func=run_search, coroutine=arun_search, name="search")
+
+
+def merge_entries(results: list[list[SearchEntry]]) -> list[SearchEntry]:
+    """Interleaves the result lists rank by rank, so every query's top hits come first, and drops repeated links."""
+    merged = list[SearchEntry]()
+    seen_links = set[str]()
+    for rank in range(max((len(entries) for entries in results), default=0)):
+        for entries in results:
+            if rank < len(entries) and entries[rank]["link"] not in seen_links:
+                seen_links.add(entries[rank]["link"])
+                merged.append(entries[rank])
+    return merged
+
+
+def multi_search_command(queries: list[str], max_results: int, results: list[tuple[list[SearchEntry], SearchFeatures]], runtime: ToolRuntime):
+    seen = seen_links(runtime)
+    features = [search_features(query_features, runtime) for _, query_features in results]
+    formatted_entries = "".join(format_features(query_features, query) for query, query_features in zip(queries, features))
+    formatted_entries += format_entries(merge_entries([entries for entries, _ in results]), seen)
+
+    # Every merged entry is shown once, so its savings are attributed to the first query that returned it.
+    actions = []
+    shown_links = set[str]()
+    for query, (entries, _), query_features in zip(queries, results, features):
+        action = SearchAction(action="search", query=query, num_docs_requested=max_results, retrieved_documents=entries)
+        if query_features:
+            action["features"] = query_features
+        record_dedup(action, [entry for entry in entries if entry["link"] not in shown_links], seen)
+        shown_links.update(entry["link"] for entry in entries)
+        actions.append(action)
 
     return Command(
         update={
             "messages": [ToolMessage(content=formatted_entries, tool_call_id=runtime.tool_call_id)],
-            "steps": [Step(step_number=runtime.state["current_step"],actions=[SearchAction(action="search", query=query, num_docs_requested=max_results, retrieved_documents=entries)])]
+            "steps": [Step(step_number=runtime.state["current_step"],actions=actions)]
         }
     )
 
 
-def browse_api_call(url: str):
-    payload = json.dumps({"url": url, "includeMarkdown": True})
-    headers = {"X-API-KEY": os.getenv("SERPER_API_KEY"),"Content-Type": "application/json"}
-    response = requests.request("POST", SERPER_SCRAPE_URL, headers=headers, data=payload)
+def validate_multi_search(queries: list[str], max_results: int) -> str | None:
+    if len(queries) == 0:
+        return "Please provide at least one query."
+    if len(queries) > MAX_MULTI_SEARCH_QUERIES:
+        return f"The maximum number of queries is {MAX_MULTI_SEARCH_QUERIES}, but got {len(queries)}. Please reduce the number of queries."
+    if max_results > 30:
+        return f"The maximum number of results is 30, but got {max_results}. Please reduce the number of results."
+    if max_results < 1:
+        return f"The number of results must be at least 1, but got {max_results}."
+    return None
+
+
+def run_multi_search(queries: list[str], max_results: int, runtime: ToolRuntime):
+    """Search the web for several queries at once, e.g. the sub-questions of a multi-hop question. The results of all queries are merged into one list without duplicates.
+
+    Args:
+        queries: The queries to search the web for, at most 5.
+        max_results: The maximum number of results to return per query, must be less than or equal to 30.
+    """
+
+    error = validate_multi_search(queries, max_results)
+    if error is not None:
+        return error
+
     try:
-        return response.json()["markdown"]
+        results = list(_query_executor.map(lambda query: search_backend_call(query, max_results, runtime), queries))
+    except (SearchApiError, NoApiKeyError, httpx.TransportError) as e:
+        return search_error_message(e)
+    maybe_prefetch(merge_entries([entries for entries, _ in results]), runtime)
+    return multi_search_command(queries, max_results, results, runtime)
+
+
+async def arun_multi_search(queries: list[str], max_results: int, runtime: ToolRuntime):
+    error = validate_multi_search(queries, max_results)
+    if error is not None:
+        return error
+
+    try:
+        results = await asyncio.gather(*(asearch_backend_call(query, max_results, runtime) for query in queries))
+    except (SearchApiError, NoApiKeyError, httpx.TransportError) as e:
+        return search_error_message(e)
+    maybe_prefetch(merge_entries([entries for entries, _ in results]), runtime, use_async=True)
+    return multi_search_command(queries, max_results, results, runtime)
+
+
+multi_search = StructuredTool.from_function(func=run_multi_search, coroutine=arun_multi_search, name="multi_search")
+
+
+def request_page(url: str, on_slot: Callable[[], None] | None = None) -> str | None:
+    """Read timeouts are not retried by http_client: a slow host fails fast into the circuit breaker, and the hedger covers the tail."""
+    payload = {"url": url, "includeMarkdown": True}
+    headers = {"Content-Type": "application/json"}
+    try:
+        response = http_client.post(SERPER_SCRAPE_URL, payload, headers, scrape_limiter, serper_keys, on_slot=on_slot)
+        run_stats.incr("scrape_api.request")
+        markdown = response.json()["markdown"]
+    except httpx.PoolTimeout:
+        # Local connection pool exhaustion, not a slow host.
+        return None
+    except httpx.TimeoutException:
+        scrape_breaker.failure(url)
+        return None
+    except Exception:
+        return None
+    # The upstream time of the last attempt, without limiter queueing or retries.
+    scrape_breaker.record(url, response.elapsed.total_seconds())
+    return markdown
+
+
+async def arequest_page(url: str, on_slot: Callable[[], None] | None = None) -> str | None:
+    payload = {"url": url, "includeMarkdown": True}
+    headers = {"Content-Type": "application/json"}
+    try:
+        response = await http_client.apost(SERPER_SCRAPE_URL, payload, headers, scrape_limiter, serper_keys, on_slot=on_slot)
+        run_stats.incr("scrape_api.request")
+        markdown = response.json()["markdown"]
+    except httpx.PoolTimeout:
+        # Local connection pool exhaustion, not a slow host.
+        return None
+    except httpx.TimeoutException:
+        scrape_breaker.failure(url)
+        return None
     except Exception:
-        return f"Failed to read the content of the URL {url}. Please verify the URL and try again."
+        return None
+    # The upstream time of the last attempt, without limiter queueing or retries.
+    scrape_breaker.record(url, response.elapsed.total_seconds())
+    return markdown
+
+
+def fetch_page(url: str) -> str | None:
+    if page_store is not None:
+        cached = page_store.get(url)
+        if cached is not None:
+            return cached
+
+    if not scrape_breaker.allow(url):
+        return None
+    markdown = scrape_hedger.call(lambda started: request_page(url, started)) if SCRAPE_HEDGING else request_page(url)
+    if markdown is None:
+        return None
+
+    if page_store is not None:
+        page_store.put(url, markdown)
+    return markdown
+
+
+async def afetch_page(url: str) -> str | None:
+    if page_store is not None:
+        cached = page_store.get(url)
+        if cached is not None:
+            return cached
+
+    if not scrape_breaker.allow(url):
+        return None
+    markdown = await scrape_hedger.acall(lambda started: arequest_page(url, started)) if SCRAPE_HEDGING else await arequest_page(url)
+    if markdown is None:
+        return None
+
+    if page_store is not None:
+        page_store.put(url, markdown)
+    return markdown
+
+
+def scrape_api_call(url: str) -> str | None:
+    """Returns the page markdown, or None if it could not be scraped."""
+    return scrape_flight.do(canonicalize_url(url), lambda: fetch_page(url))
+
+
+async def ascrape_api_call(url: str) -> str | None:
+    return await scrape_flight.ado(canonicalize_url(url), lambda: afetch_page(url))
+
+
+prefetcher = Prefetcher(scrape_api_call, ascrape_api_call)
+
+
+def browse_failure_message(url: str) -> str:
+    return f"Failed to read the content of the URL {url}. Please verify the URL and try again."
+
+
+def compact_page(markdown: str) -> str:
+    """Compacts a scraped page and records its size before and after in the run stats."""
+    compacted = compact_markdown(markdown)
+    run_stats.incr("browse.compacted_pages")
+    run_stats.incr("browse.tokens_before_compaction", estimate_tokens(markdown))
+    run_stats.incr("browse.tokens_after_compaction", estimate_tokens(compacted))
+    return compacted
+
+
+def browse_api_call(url: str, compact: bool = True):
+    markdown = scrape_api_call(url)
+    if markdown is None:
+        return browse_failure_message(url)
+    return compact_page(markdown) if compact else markdown
+
+
+async def abrowse_api_call(url: str, compact: bool = True):
+    markdown = await ascrape_api_call(url)
+    if markdown is None:
+        return browse_failure_message(url)
+    return compact_page(markdown) if compact else markdown
+
+
+def document_key(url: str, runtime: ToolRuntime) -> str:
+    configurable = runtime.config["configurable"]
+    backend = configurable.get("search_backend", "serper")
+    compact = configurable.get("compact_markdown", True)
+    return f"{backend}:{int(compact)}:{canonicalize_url(url)}"
 
 
-@tool
-def browse(url: str, runtime: ToolRuntime):
+def prepare_document(url: str, markdown: str | None, runtime: ToolRuntime) -> Document | None:
+    if markdown is None:
+        return None
+    compact = runtime.config["configurable"].get("compact_markdown", True)
+    document = Document(compact_page(markdown) if compact else markdown, estimate_tokens(markdown))
+    return documents.put(document_key(url, runtime), document)
+
+
+def read_document(url: str, runtime: ToolRuntime) -> Document | None:
+    document = documents.get(document_key(url, runtime))
+    if document is not None:
+        return document
+
+    index = local_index(runtime)
+    if index is not None:
+        return prepare_document(url, index.page(url), runtime)
+
+    markdown = prefetcher.get(url)
+    if markdown is None:
+        markdown = scrape_api_call(url)
+    return prepare_document(url, markdown, runtime)
+
+
+async def aread_document(url: str, runtime: ToolRuntime) -> Document | None:
+    document = documents.get(document_key(url, runtime))
+    if document is not None:
+        return document
+
+    index = local_index(runtime)
+    if index is not None:
+        return prepare_document(url, index.page(url), runtime)
+
+    markdown = prefetcher.get(url)
+    if markdown is None:
+        markdown = await ascrape_api_call(url)
+    return prepare_document(url, markdown, runtime)
+
+
+def page_window(url: str, document: Document, page: int, token_budget: int) -> tuple[str, int]:
+    """Returns the requested window of the document with a "page n of m" header, and the number of pages."""
+    windows = document.windows(token_budget)
+    if not 1 <= page <= len(windows):
+        return f"The page number must be between 1 and {len(windows)}, but got {page}.", len(windows)
+    header = f"[Page {page} of {len(windows)} of {url}"
+    header += f". Call browse with page={page + 1} to read on.]" if page < len(windows) else ".]"
+    return f"{header}\n\n{windows[page - 1]}", len(windows)
+
+
+def browse_command(url: str, document: Document | None, page: int, runtime: ToolRuntime):
+    configurable = runtime.config["configurable"]
+    browse_mode = configurable.get("browse_mode", "full")
+    token_budget = configurable.get("browse_token_budget", BROWSE_TOKEN_BUDGET)
+    num_pages = None
+
+    if document is None:
+        browsed_content = browse_failure_message(url)
+    elif browse_mode == "passages":
+        browsed_content = select_passages(document.text, runtime.state["question"], token_budget)
+    elif browse_mode == "paged":
+        browsed_content, num_pages = page_window(url, document, page, token_budget)
+    else:
+        browsed_content = document.text
+
+    action = BrowseAction(
+        action="browse",
+        url=url,
+        browsed_content=browsed_content,
+        content_tokens=document.raw_tokens if document is not None else 0,
+        returned_tokens=estimate_tokens(browsed_content),
+    )
+    if document is not None and configurable.get("compact_markdown", True):
+        action["compacted_tokens"] = estimate_tokens(document.text)
+    if num_pages is not None:
+        action["page"] = page
+        action["num_pages"] = num_pages
+    return Command(
+        update={"messages": [ToolMessage(content=browsed_content, tool_call_id=runtime.tool_call_id)],
+                "steps": [Step(step_number=runtime.state["current_step"],actions=[action])]}
+    )
+
+
+def run_browse(url: str, runtime: ToolRuntime, page: int = 1):
     """Browse the web for the given URL.
 
     Args:
         url: The URL to browse the web for.
+        page: Which page of a long document to read, starting from 1. Long documents are split into pages with a "[Page n of m]" header.
     """
-    browsed_content = browse_api_call(url)
+    return browse_command(url, read_document(url, runtime), page, runtime)
+
+
+async def arun_browse(url: str, runtime: ToolRuntime, page: int = 1):
+    return browse_command(url, await aread_document(url, runtime), page, runtime)
+
+
+browse = StructuredTool.from_function(func=run_browse, coroutine=arun_browse, name="browse")
+
+
+def find_in_page_command(url: str, terms: list[str], document: Document | None, runtime: ToolRuntime):
+    if document is None:
+        found_content, num_matches = browse_failure_message(url), 0
+    else:
+        index = document.index()
+        line_numbers, num_matches = index.find(terms)
+        if num_matches == 0:
+            found_content = f"None of the terms {terms} occur in {url}. Try other terms, or browse the page."
+        else:
+            found_content = f"[{num_matches} lines of {url} match {terms}, showing {len(line_numbers)}.]\n\n"
+            found_content += "\n...\n".join(index.excerpt(line_numbers, terms))
+    run_stats.incr("find_in_page.returned_tokens", estimate_tokens(found_content))
+
+    action = FindInPageAction(action="find_in_page", url=url, terms=terms, num_matches=num_matches, found_content=found_content)
     return Command(
-        update={"messages": [ToolMessage(content=browsed_content, tool_call_id=runtime.tool_call_id)],
-                "steps": [Step(step_number=runtime.state["current_step"],actions=[BrowseAction(action="browse", url=url, browsed_content=browsed_content)])]}
+        update={"messages": [ToolMessage(content=found_content, tool_call_id=runtime.tool_call_id)],
+                "steps": [Step(step_number=runtime.state["current_step"],actions=[action])]}
     )
 
 
+def validate_find_in_page(terms: list[str]) -> str | None:
+    if not terms:
+        return "Please provide at least one term to find."
+    if len(terms) > MAX_FIND_TERMS:
+        return f"The maximum number of terms is {MAX_FIND_TERMS}, but got {len(terms)}. Please reduce the number of terms."
+    return None
+
+
+def run_find_in_page(url: str, terms: list[str], runtime: ToolRuntime):
+    """Find the lines of a web page that mention any of the given terms, with their surrounding lines. Much cheaper than browsing the whole page when looking for a specific fact.
+
+    Args:
+        url: The URL of the page to search in.
+        terms: Words or short phrases to look for (case-insensitive), e.g. ["born", "birth date"], at most 10.
+    """
+
+    error = validate_find_in_page(terms)
+    if error is not None:
+        return error
+    return find_in_page_command(url, terms, read_document(url, runtime), runtime)
+
+
+async def arun_find_in_page(url: str, terms: list[str], runtime: ToolRuntime):
+    error = validate_find_in_page(terms)
+    if error is not None:
+        return error
+    return find_in_page_command(url, terms, await aread_document(url, runtime), runtime)
+
+
+find_in_page = StructuredTool.from_function(func=run_find_in_page, coroutine=arun_find_in_page, name="find_in_page")
+
+
 if __name__ == "__main__":
     print(search_api_call("\"He Ain't Heavy He's My Brother\" song information history", 10))